@@ -0,0 +1,566 @@
+#!/usr/bin/env python3
+"""
+Shared I/O helpers for the pipelines/ scripts.
+
+- open_dump(): buffered streaming reader for the gzipped Discogs dumps, with
+  decompression read ahead on a background thread
+- pyarrow is imported once here (HAS_PYARROW) instead of probed in every script
+- output column lists + Arrow schemas for the XML extractors
+- pause_gc(): cyclic GC off for the parse loop (gen-0 sweeps after each batch)
+- PartWriter: rolling Parquet writer (one row group per batch, new file every N rows),
+  compressing/writing on a background thread while the caller keeps parsing
+
+The scripts are run directly (python3 pipelines/<script>.py), so this module is
+imported as a sibling: `from _pipeline_io import ...`.
+"""
+
+from __future__ import annotations
+
+import gc
+import io
+import queue
+import shutil
+import subprocess
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:  # fastparquet-only environments
+    pa = None
+    pq = None
+    HAS_PYARROW = False
+
+# Incremental Arrow string builder (not re-exported at pyarrow top level)
+try:
+    from pyarrow.lib import StringBuilder
+except ImportError:
+    StringBuilder = None
+
+
+# ISA-L igzip (SIMD inflate + CRC) is a drop-in for gzip and several times faster
+try:
+    from isal import igzip as gzip_mod
+    HAS_ISAL = True
+except ImportError:
+    import gzip as gzip_mod
+    HAS_ISAL = False
+
+# Without isal, an installed pigz inflates in its own process (off the parser's
+# core, with separate read/write/CRC threads) and is piped in.
+PIGZ = shutil.which("pigz")
+
+
+def preferred_engine() -> str:
+    return "pyarrow" if HAS_PYARROW else "fastparquet"
+
+
+# ============================================================
+# Dump input
+# ============================================================
+
+# Read size in front of the decompressor: parsers ask for small chunks, and
+# inflating in 1 MiB blocks instead of the 8 KiB default cuts per-call overhead.
+DUMP_BUFFER_SIZE = 1 << 20
+
+# Decompressed blocks kept ready ahead of the parser (0 = no readahead thread)
+DUMP_READAHEAD = 8
+
+
+class _ReadaheadReader(io.RawIOBase):
+    """
+    Raw stream fed by a background thread that keeps up to `depth` blocks of
+    `src` read ahead. zlib/igzip inflate and the disk reads release the GIL,
+    so decompression overlaps with parsing on the main thread.
+    """
+
+    def __init__(self, src, block_size: int, depth: int) -> None:
+        super().__init__()
+        self._src = src
+        self._block_size = block_size
+        self._queue: queue.Queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._view = memoryview(b"")
+        self._eof = False
+        self._thread = threading.Thread(target=self._fill, name="dump-readahead", daemon=True)
+        self._thread.start()
+
+    def _fill(self) -> None:
+        try:
+            while not self._stop.is_set():
+                block = self._src.read(self._block_size)
+                self._put(block)
+                if not block:  # b"" marks EOF
+                    return
+        except BaseException as e:  # re-raised by readinto() on the reader's thread
+            self._put(e)
+
+    def _put(self, item) -> None:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._view:
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._view = memoryview(item)
+        n = min(len(b), len(self._view))
+        b[:n] = self._view[:n]
+        self._view = self._view[n:]
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._src.close()
+        super().close()
+
+
+class _ProcessReader(io.RawIOBase):
+    """Raw stream over a decompressor's stdout; a non-zero exit at EOF raises (corrupt dump)."""
+
+    def __init__(self, cmd: List[str]) -> None:
+        super().__init__()
+        self._cmd = cmd
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = self._proc.stdout.readinto(b)
+        if not n and self._proc.wait() != 0:
+            raise OSError(f"{self._cmd[0]} exited with status {self._proc.returncode}")
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._proc.stdout.close()
+            if self._proc.poll() is None:  # closed early (e.g. --max-parts)
+                self._proc.kill()
+            self._proc.wait()
+        super().close()
+
+
+def open_dump(path: Path, buffer_size: int = DUMP_BUFFER_SIZE, readahead: int = DUMP_READAHEAD):
+    """
+    Open a gzipped dump for binary streaming reads.
+
+    Decompressor: isal igzip if installed, else `pigz -dc` if on PATH, else gzip.
+    With readahead > 0, a background thread reads and decompresses up to
+    `readahead` blocks of buffer_size ahead of the parser.
+    """
+    if not HAS_ISAL and PIGZ:
+        src = _ProcessReader([PIGZ, "-dc", str(path)])
+    else:
+        src = gzip_mod.open(path, "rb")
+    if readahead > 0:
+        src = _ReadaheadReader(src, buffer_size, readahead)
+    return io.BufferedReader(src, buffer_size=buffer_size)
+
+
+def pause_gc() -> None:
+    """
+    Call once before a pipeline's parse loop (the process exits after it).
+
+    Everything allocated so far (modules, schemas, parser setup) is moved to
+    the permanent generation with gc.freeze() so it is never scanned again, and
+    automatic cyclic GC is disabled: per-record objects are freed by refcount,
+    and the periodic full scans over millions of live rows are pure overhead.
+    PartWriter.write() runs a cheap gen-0 collection after each batch while
+    GC is paused, which picks up any stray cycles.
+    """
+    gc.collect()
+    gc.freeze()
+    gc.disable()
+
+
+# ============================================================
+# Output columns (DECLARE ONCE)
+# ============================================================
+
+ARTISTS_COLUMNS: List[str] = [
+    "artist_id",
+    "name",
+    "realname",
+    "profile",
+    "data_quality",
+    "urls",
+    "namevariations",
+    "aliases",
+]
+
+MASTERS_COLUMNS: List[str] = [
+    "master_id",
+    "main_release_id",
+    "title",
+    "year",
+    "master_artists",
+    "master_artist_ids",
+    "genres",
+    "styles",
+    "data_quality",
+]
+
+RELEASES_COLUMNS: List[str] = [
+    "release_id",
+    "master_id",
+    "title",
+    "artists",
+    "labels",
+    "label_catnos",
+    "country",
+    "formats",
+    "genres",
+    "styles",
+    "credits_flat",
+    "status",
+    "released",
+    "data_quality",
+    "format_qtys",
+    "format_texts",
+    "format_descriptions",
+    "identifiers_flat",
+]
+
+LABELS_COLUMNS: List[str] = [
+    "label_id",
+    "name",
+    "profile",
+    "contact_info",
+    "data_quality",
+    "parent_label_id",
+    "parent_label_name",
+    "urls_csv",
+    "sublabel_ids_csv",
+    "sublabel_names_csv",
+]
+
+COLLECTION_COLUMNS: List[str] = [
+    "instance_id",
+    "release_id",
+    "title",
+    "artists",
+    "labels",
+    "year",
+    "formats",
+    "genres",
+    "styles",
+    "date_added",
+    "rating",
+]
+
+# int64 columns per dataset (everything else is string)
+ARTISTS_INT_COLUMNS_TYPED = frozenset({"artist_id"})
+ARTISTS_INT_COLUMNS_LEGACY: frozenset = frozenset()
+MASTERS_INT_COLUMNS_TYPED = frozenset({"master_id", "main_release_id", "year"})
+MASTERS_INT_COLUMNS_LEGACY = frozenset({"year"})
+RELEASES_INT_COLUMNS = frozenset({"release_id", "master_id"})
+LABELS_INT_COLUMNS = frozenset({"label_id", "parent_label_id"})
+COLLECTION_INT_COLUMNS = frozenset({"instance_id", "release_id", "year", "rating"})
+
+# Low-cardinality text columns worth dictionary-encoding. Near-unique columns
+# (IDs, titles, profiles, credits, identifiers) are written PLAIN: the
+# dictionary would be as large as the data and only slows the writer down.
+ARTISTS_DICTIONARY_COLUMNS = frozenset({"data_quality"})
+MASTERS_DICTIONARY_COLUMNS = frozenset({"genres", "styles", "data_quality"})
+RELEASES_DICTIONARY_COLUMNS = frozenset({
+    "artists",
+    "labels",
+    "country",
+    "formats",
+    "genres",
+    "styles",
+    "status",
+    "released",
+    "data_quality",
+    "format_qtys",
+    "format_texts",
+    "format_descriptions",
+})
+LABELS_DICTIONARY_COLUMNS = frozenset({"data_quality", "parent_label_name"})
+COLLECTION_DICTIONARY_COLUMNS = frozenset({"artists", "labels", "formats", "genres", "styles"})
+
+
+@lru_cache(maxsize=None)
+def _arrow_schema(columns: tuple, int_columns: frozenset):
+    return pa.schema(
+        [(c, pa.int64() if c in int_columns else pa.string()) for c in columns]
+    )
+
+
+def arrow_schema(columns: Iterable[str], int_columns: Iterable[str]):
+    """Arrow schema with explicit types (keeps text VARCHAR, never BLOB). Cached."""
+    return _arrow_schema(tuple(columns), frozenset(int_columns))
+
+
+if HAS_PYARROW:
+    SCHEMA_ARTISTS = arrow_schema(ARTISTS_COLUMNS, ARTISTS_INT_COLUMNS_LEGACY)
+    SCHEMA_ARTISTS_TYPED = arrow_schema(ARTISTS_COLUMNS, ARTISTS_INT_COLUMNS_TYPED)
+    SCHEMA_MASTERS = arrow_schema(MASTERS_COLUMNS, MASTERS_INT_COLUMNS_LEGACY)
+    SCHEMA_MASTERS_TYPED = arrow_schema(MASTERS_COLUMNS, MASTERS_INT_COLUMNS_TYPED)
+    SCHEMA_RELEASES = arrow_schema(RELEASES_COLUMNS, RELEASES_INT_COLUMNS)
+    SCHEMA_LABELS = arrow_schema(LABELS_COLUMNS, LABELS_INT_COLUMNS)
+    SCHEMA_COLLECTION = arrow_schema(COLLECTION_COLUMNS, COLLECTION_INT_COLUMNS)
+else:
+    SCHEMA_ARTISTS = SCHEMA_ARTISTS_TYPED = None
+    SCHEMA_MASTERS = SCHEMA_MASTERS_TYPED = None
+    SCHEMA_RELEASES = None
+    SCHEMA_LABELS = None
+    SCHEMA_COLLECTION = None
+
+
+# ============================================================
+# Rolling Parquet writer
+# ============================================================
+
+# Parquet writer settings (pyarrow): zstd L3 is markedly smaller than snappy at
+# similar decode speed, which is what Trino/DuckDB pay for on every scan.
+PARQUET_WRITER_OPTIONS: Dict[str, Any] = {
+    "compression": "zstd",
+    "compression_level": 3,
+    "use_dictionary": True,
+    "data_page_size": 1 << 20,
+    "write_batch_size": 8192,
+}
+
+
+def to_parquet_options(engine: str, rows: int) -> Dict[str, Any]:
+    """
+    DataFrame.to_parquet() kwargs for writers still going through pandas:
+    same codec as PartWriter, and the whole batch (`rows`) as one row group.
+    """
+    if engine == "pyarrow":
+        return {
+            "compression": PARQUET_WRITER_OPTIONS["compression"],
+            "compression_level": PARQUET_WRITER_OPTIONS["compression_level"],
+            "row_group_size": max(rows, 1),
+        }
+    return {"compression": PARQUET_WRITER_OPTIONS["compression"], "row_group_offsets": max(rows, 1)}
+
+
+class PartWriter:
+    """
+    Write column batches to a Parquet dataset directory.
+
+    pyarrow:     one ParquetWriter held open across batches; each write() is one
+                 row group, and the file rolls over after rows_per_file rows.
+                 Encoding/compression/disk writes run on a background thread fed
+                 through a bounded queue (one batch being written, WRITE_QUEUE_SIZE
+                 waiting), so parsing continues while the previous batch is written.
+    fastparquet: no incremental writer; each write() appends one row group to
+                 the current file (pandas to_parquet(append=True)) on the caller's
+                 thread, rolling after rows_per_file rows like pyarrow.
+
+    `part` counts files started so far; file names come from file_pattern.
+    Both are tracked on the caller's thread, so they are exact right after
+    write() returns.
+
+    Encoding: dictionary_columns get dictionary encoding (default: all string
+    columns) and statistics_columns get min/max stats (default: int columns,
+    which is what Trino/DuckDB prune row groups on).
+
+    Callers fill the buffers from new_buffers() (anything with .append and
+    len()) and hand them to write(), which resets them for the next batch.
+    On pyarrow, string columns are StringBuilders: values go straight into
+    Arrow buffers on append, and flush just finishes the builder instead of
+    re-encoding a Python list.
+
+    close() waits for queued writes and re-raises any error from the writer
+    thread; errors also surface on the next write(). After an error the writer
+    stays failed: later writes and close() raise again, and the file being
+    written is deleted instead of finalized.
+    """
+
+    # Batches waiting behind the one being written (bounds memory, applies backpressure)
+    WRITE_QUEUE_SIZE = 2
+
+    def __init__(
+        self,
+        out_dir: Path,
+        columns: List[str],
+        int_columns: Iterable[str] = (),
+        engine: Optional[str] = None,
+        rows_per_file: int = 1_000_000,
+        file_pattern: str = "part-{part:05d}.parquet",
+        dictionary_columns: Optional[Iterable[str]] = None,
+        statistics_columns: Optional[Iterable[str]] = None,
+    ) -> None:
+        self.out_dir = out_dir
+        self.columns = list(columns)
+        self.int_columns = frozenset(int_columns)
+        self.engine = engine or preferred_engine()
+        self.rows_per_file = rows_per_file
+        self.file_pattern = file_pattern
+        self.schema = arrow_schema(self.columns, self.int_columns) if self.engine == "pyarrow" else None
+
+        if dictionary_columns is None:
+            dictionary_columns = [c for c in self.columns if c not in self.int_columns]
+        if statistics_columns is None:
+            statistics_columns = self.int_columns
+        dictionary_columns = set(dictionary_columns)
+        statistics_columns = set(statistics_columns)
+        self.writer_options = dict(
+            PARQUET_WRITER_OPTIONS,
+            use_dictionary=[c for c in self.columns if c in dictionary_columns],
+            write_statistics=[c for c in self.columns if c in statistics_columns],
+        )
+
+        self.part = 0
+        self.rows_written = 0
+        self._file: Optional[Path] = None
+        self._rows_in_file = 0
+
+        # background writer (pyarrow only), started on first write()
+        self._queue: Optional[queue.Queue] = None
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+
+    def new_buffers(self) -> List[Any]:
+        """Per-column append buffers in column order."""
+        if self.engine == "pyarrow" and StringBuilder is not None:
+            return [[] if c in self.int_columns else StringBuilder() for c in self.columns]
+        return [[] for _ in self.columns]
+
+    def write(self, data: List[Any]) -> int:
+        """Write one batch of per-column buffers (column order) and reset them. Returns rows written."""
+        n = len(data[0]) if data else 0
+        if not n:
+            return 0
+
+        append = self._file is not None
+        if not append:
+            self._file = self.out_dir / self.file_pattern.format(part=self.part)
+
+        if self.engine == "pyarrow":
+            arrays = [
+                pa.array(col, type=f.type) if isinstance(col, list) else col.finish()
+                for col, f in zip(data, self.schema)
+            ]
+            self._submit(("write", self._file, pa.RecordBatch.from_arrays(arrays, schema=self.schema)))
+        else:
+            df = pd.DataFrame({
+                c: pd.array(col, dtype="Int64" if c in self.int_columns else "string")
+                for c, col in zip(self.columns, data)
+            })
+            df.to_parquet(self._file, engine=self.engine, index=False, append=append,
+                          **to_parquet_options(self.engine, n))
+            print(f"💾 Written {n:,} rows → {self._file.name}")
+
+        self._rows_in_file += n
+        if self._rows_in_file >= self.rows_per_file:
+            self._roll()
+
+        for col in data:
+            if isinstance(col, list):
+                col.clear()
+
+        self.rows_written += n
+        if not gc.isenabled():  # pause_gc(): sweep the young generation per batch
+            gc.collect(0)
+        return n
+
+    def write_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """Write one batch given as row dicts (missing keys → null). Returns rows written."""
+        return self.write([[r.get(c) for r in rows] for c in self.columns])
+
+    def _roll(self) -> None:
+        """Queue closing the current file (if any); the next write() starts a new one."""
+        if self._file is None:
+            return
+        if self.engine == "pyarrow":
+            self._submit(("close", self._file, self._rows_in_file))
+        else:
+            print(f"📦 Closed {self._file.name} ({self._rows_in_file:,} rows)")
+        self._file = None
+        self._rows_in_file = 0
+        self.part += 1
+
+    def _submit(self, task: tuple) -> None:
+        if self._error is not None:
+            self._raise_error()
+        if self._thread is None:
+            self._queue = queue.Queue(maxsize=self.WRITE_QUEUE_SIZE)
+            self._thread = threading.Thread(target=self._run, name="parquet-writer", daemon=True)
+            self._thread.start()
+        self._queue.put(task)
+
+    def _run(self) -> None:
+        """Writer thread: owns the ParquetWriter; drains tasks until the None sentinel."""
+        writer = None
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            if self._error is not None:
+                continue  # keep draining so the producer never blocks
+            try:
+                kind, path = task[0], task[1]
+                if kind == "write":
+                    if writer is None:
+                        writer = pq.ParquetWriter(path, self.schema, **self.writer_options)
+                    batch = task[2]
+                    writer.write_batch(batch)
+                    print(f"💾 Written {batch.num_rows:,} rows → {path.name}")
+                elif writer is not None:
+                    writer.close()
+                    writer = None
+                    print(f"📦 Closed {path.name} ({task[2]:,} rows)")
+            except BaseException as e:  # re-raised on the caller's thread
+                self._error = e
+                # drop the partial file: a truncated part must not look like valid output
+                if writer is not None:
+                    try:
+                        writer.close()
+                    except BaseException:
+                        pass
+                    writer = None
+                path.unlink(missing_ok=True)
+        if writer is not None:
+            writer.close()
+
+    def _raise_error(self) -> None:
+        # _error stays set: the writer is unusable once a write failed
+        raise RuntimeError(f"Parquet writer thread failed: {self._error}") from self._error
+
+    def close(self) -> None:
+        """Close the current file (if any) and wait for pending writes; the next write() starts a new one."""
+        try:
+            if self._error is None:
+                self._roll()
+        finally:
+            # always join, also when _roll() raised the writer thread's error
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+                self._queue = None
+        if self._error is not None:
+            self._raise_error()
+
+    def __enter__(self) -> "PartWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
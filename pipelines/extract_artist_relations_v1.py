@@ -26,7 +26,7 @@ Typed mode (--typed):
 from __future__ import annotations
 
 import argparse
-import gzip
+import gc
 import os
 import sys
 import shutil
@@ -36,6 +36,8 @@ from typing import Optional, List, Dict, Any
 
 import pandas as pd
 
+from _pipeline_io import open_dump, pause_gc, preferred_engine, to_parquet_options
+
 
 def text_or_none(x: Any) -> Optional[str]:
     if x is None:
@@ -44,14 +46,6 @@ def text_or_none(x: Any) -> Optional[str]:
     return s or None
 
 
-def parquet_engine_preferred() -> str:
-    try:
-        import pyarrow  # noqa: F401
-        return "pyarrow"
-    except Exception:
-        return "fastparquet"
-
-
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Extract Discogs artist aliases and memberships to Parquet.")
     p.add_argument("--src", help="Path to discogs artists.xml.gz")
@@ -88,8 +82,9 @@ def resolve_paths(args: argparse.Namespace) -> tuple[Path, Path, Path]:
     return src, out_aliases, out_members
 
 
-def to_int64_series(df: pd.DataFrame, col: str) -> pd.Series:
-    return pd.to_numeric(df[col], errors="coerce").astype("Int64")
+def to_id_or_none(s: Optional[str]) -> Optional[int]:
+    """Discogs ID string → int; non-numeric/missing → None (dropped or null in typed output)."""
+    return int(s) if s and s.isdecimal() else None
 
 
 def write_parquet_part(
@@ -107,10 +102,11 @@ def write_parquet_part(
     dropped = 0
 
     if typed and not df.empty:
+        # IDs were already parsed to int/None at ingest: just wrap as Int64
         if prefix == "alias":
-            df["artist_id"] = to_int64_series(df, "artist_id")
+            df["artist_id"] = pd.array([r["artist_id"] for r in rows], dtype="Int64")
             # alias_id can be missing in dump; cast but don't require it
-            df["alias_id"] = to_int64_series(df, "alias_id")
+            df["alias_id"] = pd.array([r["alias_id"] for r in rows], dtype="Int64")
 
             dropped = int(df["artist_id"].isna().sum())
             if dropped:
@@ -118,8 +114,8 @@ def write_parquet_part(
             df = df[df["artist_id"].notna()]
 
         elif prefix == "membership":
-            df["group_id"] = to_int64_series(df, "group_id")
-            df["member_id"] = to_int64_series(df, "member_id")
+            df["group_id"] = pd.array([r["group_id"] for r in rows], dtype="Int64")
+            df["member_id"] = pd.array([r["member_id"] for r in rows], dtype="Int64")
 
             dropped = int((df["group_id"].isna() | df["member_id"].isna()).sum())
             if dropped:
@@ -127,7 +123,7 @@ def write_parquet_part(
             df = df[df["group_id"].notna() & df["member_id"].notna()]
 
     out_file = out_dir / f"part-{part:05d}.parquet"
-    df.to_parquet(out_file, engine=engine, index=False)
+    df.to_parquet(out_file, engine=engine, index=False, **to_parquet_options(engine, len(df)))
     print(f"💾 Written {len(df):,} {prefix} rows → {out_file.name}")
     return len(df), dropped
 
@@ -135,7 +131,7 @@ def write_parquet_part(
 def main() -> int:
     args = parse_args()
     src, out_aliases, out_members = resolve_paths(args)
-    engine = args.engine or parquet_engine_preferred()
+    engine = args.engine or preferred_engine()
     batch = int(args.batch)
 
     if not src.exists():
@@ -176,6 +172,7 @@ def main() -> int:
         dropped_aliases_total += dropped
         rows_aliases = []
         part_aliases += 1
+        gc.collect(0)
 
     def flush_members() -> None:
         nonlocal rows_members, part_members, written_members_total, dropped_members_total
@@ -186,14 +183,20 @@ def main() -> int:
         dropped_members_total += dropped
         rows_members = []
         part_members += 1
+        gc.collect(0)
+
+    to_id = to_id_or_none if args.typed else (lambda s: s)
 
-    with gzip.open(src, "rb") as f:
+    pause_gc()
+    with open_dump(src) as f:
         for event, elem in ET.iterparse(f, events=("end",)):
             if elem.tag != "artist":
                 continue
 
             artist_id = text_or_none(elem.findtext("id"))
             artist_name = text_or_none(elem.findtext("name"))
+            # typed: IDs become int/None here, once, instead of re-parsed per batch
+            artist_key = to_id(artist_id)
 
             # --- ALIASES ---
             aliases_elem = elem.find("aliases")
@@ -204,8 +207,8 @@ def main() -> int:
                     if alias_name:
                         rows_aliases.append(
                             {
-                                "artist_id": artist_id,
-                                "alias_id": alias_id,
+                                "artist_id": artist_key,
+                                "alias_id": to_id(alias_id),
                                 "alias_name": alias_name,
                             }
                         )
@@ -219,9 +222,9 @@ def main() -> int:
                     if member_name:
                         rows_members.append(
                             {
-                                "group_id": artist_id,
+                                "group_id": artist_key,
                                 "group_name": artist_name,
-                                "member_id": member_id,
+                                "member_id": to_id(member_id),
                                 "member_name": member_name,
                             }
                         )
@@ -234,9 +237,9 @@ def main() -> int:
                     if group_name:
                         rows_members.append(
                             {
-                                "group_id": group_id,
+                                "group_id": to_id(group_id),
                                 "group_name": group_name,
-                                "member_id": artist_id,
+                                "member_id": artist_key,
                                 "member_name": artist_name,
                             }
                         )
@@ -18,20 +18,32 @@ ENV vars:
 from __future__ import annotations
 
 import argparse
-import gzip
 import os
+import re
 import sys
 import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Any
 
-import pandas as pd
+from _pipeline_io import (
+    ARTISTS_COLUMNS,
+    ARTISTS_DICTIONARY_COLUMNS,
+    ARTISTS_INT_COLUMNS_LEGACY,
+    ARTISTS_INT_COLUMNS_TYPED,
+    PartWriter,
+    open_dump,
+    pause_gc,
+    preferred_engine,
+)
+
+
+OUTPUT_COLUMNS: List[str] = ARTISTS_COLUMNS
 
 
 def text_or_none(x: Optional[str]) -> Optional[str]:
     if x is None:
         return None
-    s = str(x).strip()
+    s = x.strip()
     return s or None
 
 
@@ -39,23 +51,86 @@ def join_csv(values: List[str]) -> Optional[str]:
     return ", ".join(values) if values else None
 
 
-def preferred_parquet_engine() -> str:
+def to_int_or_none(x: Optional[str]) -> Optional[int]:
+    if not x:
+        return None
+    # fast path: plain digits never raise; int() still handles signs/whitespace
+    if x.isdecimal():
+        return int(x)
     try:
-        import pyarrow  # noqa: F401
-        return "pyarrow"
-    except Exception:
-        return "fastparquet"
+        return int(x)
+    except ValueError:
+        return None
+
+
+def iter_artists_iterparse(f):
+    """Yield each <artist> element; clears it (and the root) once consumed."""
+    # start events give us the root; clearing it drops processed records
+    # that the root would otherwise keep referencing for the whole run
+    context = ET.iterparse(f, events=("start", "end"))
+    _, root = next(context)
+
+    for event, elem in context:
+        if event != "end" or elem.tag != "artist":
+            continue
+        yield elem
+        elem.clear()
+        root.clear()
+
+
+_ARTIST_OPEN = re.compile(rb"<artist[\s>]")
+_ARTIST_CLOSE = b"</artist>"
+
+
+def iter_artists_prefiltered(f, window: int = 64 << 20):
+    """
+    Yield each <artist> element by slicing complete <artist>...</artist> blocks
+    out of the decompressed byte stream and parsing only those.
+
+    Safe because <artist> never nests inside itself in the artists dump;
+    the open-tag pattern does not match the <artists> root.
+    """
+    buf = bytearray()
+    eof = False
+    while not eof:
+        chunk = f.read(window)
+        if chunk:
+            buf += chunk
+        else:
+            eof = True
+
+        pos = 0
+        while True:
+            m = _ARTIST_OPEN.search(buf, pos)
+            if m is None:
+                # keep a tail long enough to hold a split open tag
+                pos = max(pos, len(buf) - len(_ARTIST_CLOSE))
+                break
+            start = m.start()
+            end = buf.find(_ARTIST_CLOSE, start)
+            if end < 0:
+                pos = start
+                break
+            end += len(_ARTIST_CLOSE)
+            yield ET.fromstring(bytes(buf[start:end]))
+            pos = end
+
+        del buf[:pos]
 
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Extract Discogs artists dump to Parquet.")
     p.add_argument("--src", help="Path to artists XML dump (*.xml.gz). Overrides DISCOGS_ARTISTS_DUMP.")
     p.add_argument("--out", help="Output directory override.")
-    p.add_argument("--batch", type=int, default=50_000, help="Rows per Parquet part (default: 50000).")
+    p.add_argument("--batch", type=int, default=50_000, help="Rows per record batch / row group (default: 50000).")
+    p.add_argument("--rows-per-file", type=int, default=1_000_000,
+                   help="Roll to a new Parquet file after N rows (default: 1000000).")
     p.add_argument("--engine", choices=["pyarrow", "fastparquet"], default=None, help="Parquet engine override.")
     p.add_argument("--clean", action="store_true", help="Delete existing *.parquet in output dir before writing.")
-    p.add_argument("--max-parts", type=int, default=None, help="Stop after writing N parts (debug).")
+    p.add_argument("--max-parts", type=int, default=None, help="Stop after writing N batches (debug).")
     p.add_argument("--typed", action="store_true", help="Write typed IDs (artist_id BIGINT) to artists_v1_typed.")
+    p.add_argument("--prefilter", action="store_true",
+                   help="Slice <artist> blocks out of the raw byte stream and parse only those (skips iterparse).")
     return p.parse_args()
 
 
@@ -102,124 +177,112 @@ def main() -> int:
         if old:
             print(f"🧹 Cleaned {len(old)} parquet files in {out_dir}")
 
-    engine = args.engine or preferred_parquet_engine()
+    engine = args.engine or preferred_engine()
 
     print(f"📥 Source: {src}")
     print(f"📦 Output: {out_dir}")
-    print(f"⚙️  batch={args.batch} engine={engine} clean={bool(args.clean)} typed={bool(args.typed)} max_parts={args.max_parts}")
+    print(f"⚙️  batch={args.batch} rows_per_file={args.rows_per_file} engine={engine} clean={bool(args.clean)} typed={bool(args.typed)} max_parts={args.max_parts} prefilter={bool(args.prefilter)}")
 
-    rows: List[Dict[str, Any]] = []
-    part = 0
+    batches = 0
+    dropped_batch = 0
     dropped_total = 0
-    written_total = 0
+
+    writer = PartWriter(
+        out_dir,
+        OUTPUT_COLUMNS,
+        ARTISTS_INT_COLUMNS_TYPED if args.typed else ARTISTS_INT_COLUMNS_LEGACY,
+        engine=engine,
+        rows_per_file=args.rows_per_file,
+        dictionary_columns=ARTISTS_DICTIONARY_COLUMNS,
+    )
+
+    # Column-oriented buffer (Arrow string builders on pyarrow);
+    # in typed mode artist_id is parsed to int at append time
+    columns = writer.new_buffers()
 
     def flush() -> None:
-        nonlocal rows, part, dropped_total, written_total
-        if not rows:
+        nonlocal batches, dropped_batch, dropped_total
+        if dropped_batch:
+            print(f"⚠️  artists_v1_typed: dropping {dropped_batch:,} rows with non-numeric artist_id (batch)")
+            dropped_total += dropped_batch
+            dropped_batch = 0
+
+        if not columns[0]:
             return
 
-        df = pd.DataFrame(
-            rows,
-            columns=[
-                "artist_id",
-                "name",
-                "realname",
-                "profile",
-                "data_quality",
-                "urls",
-                "namevariations",
-                "aliases",
-            ],
-        )
-
-        dropped_batch = 0
-        if args.typed:
-            # cast artist_id to numeric; drop non-numeric ids
-            df["artist_id"] = pd.to_numeric(df["artist_id"], errors="coerce").astype("Int64")
-            dropped_batch = int(df["artist_id"].isna().sum())
-            if dropped_batch:
-                print(f"⚠️  artists_v1_typed: dropping {dropped_batch:,} rows with non-numeric artist_id (batch)")
-            df = df[df["artist_id"].notna()]
-
-        out_file = out_dir / f"part-{part:05d}.parquet"
-        df.to_parquet(out_file, engine=engine, index=False)
-
-        written = len(df)
-        written_total += written
-        dropped_total += dropped_batch
-
-        print(f"💾 Written {written:,} rows → {out_file.name}")
-
-        rows = []
-        part += 1
-
-    with gzip.open(src, "rb") as f:
-        for event, elem in ET.iterparse(f, events=("end",)):
-            if elem.tag != "artist":
-                continue
-
-            artist_id = text_or_none(elem.findtext("id")) or text_or_none(elem.get("id"))
-            name = text_or_none(elem.findtext("name"))
-            realname = text_or_none(elem.findtext("realname"))
-            profile = text_or_none(elem.findtext("profile"))
-            data_quality = text_or_none(elem.findtext("data_quality"))
-
-            urls_list: List[str] = []
-            urls_elem = elem.find("urls")
-            if urls_elem is not None:
-                for u in urls_elem.findall("url"):
-                    utxt = text_or_none(u.text)
-                    if utxt:
-                        urls_list.append(utxt)
-            urls = join_csv(urls_list)
-
-            nv_list: List[str] = []
-            nv_elem = elem.find("namevariations")
-            if nv_elem is not None:
-                for n in nv_elem.findall("name"):
-                    ntxt = text_or_none(n.text)
-                    if ntxt:
-                        nv_list.append(ntxt)
-            namevariations = join_csv(nv_list)
-
-            aliases_list: List[str] = []
-            aliases_elem = elem.find("aliases")
-            if aliases_elem is not None:
-                for a in aliases_elem.findall("name"):
-                    atxt = text_or_none(a.text)
-                    if atxt:
-                        aliases_list.append(atxt)
-            aliases = join_csv(aliases_list)
-
-            rows.append(
-                {
-                    "artist_id": artist_id,
-                    "name": name,
-                    "realname": realname,
-                    "profile": profile,
-                    "data_quality": data_quality,
-                    "urls": urls,
-                    "namevariations": namevariations,
-                    "aliases": aliases,
-                }
-            )
-
-            if len(rows) >= args.batch:
-                flush()
-                if args.max_parts is not None and part >= args.max_parts:
-                    print(f"🧪 max-parts reached ({args.max_parts}), stopping early.")
-                    elem.clear()
-                    break
-
-            elem.clear()
-
-    flush()
+        writer.write(columns)
+        batches += 1
+
+    # per-record hot loop reads locals, not argparse attributes
+    batch = args.batch
+    typed = bool(args.typed)
+    max_parts = args.max_parts
+
+    pause_gc()
+    try:
+        with open_dump(src) as f:
+            records = iter_artists_prefiltered(f) if args.prefilter else iter_artists_iterparse(f)
+
+            for elem in records:
+                artist_id: Any = text_or_none(elem.findtext("id")) or text_or_none(elem.get("id"))
+                if typed:
+                    # artist_id is mandatory for typed dataset
+                    artist_id = to_int_or_none(artist_id)
+                    if artist_id is None:
+                        dropped_batch += 1
+                        continue
+
+                name = text_or_none(elem.findtext("name"))
+                realname = text_or_none(elem.findtext("realname"))
+                profile = text_or_none(elem.findtext("profile"))
+                data_quality = text_or_none(elem.findtext("data_quality"))
+
+                urls_list: List[str] = []
+                urls_elem = elem.find("urls")
+                if urls_elem is not None:
+                    for u in urls_elem.findall("url"):
+                        utxt = text_or_none(u.text)
+                        if utxt:
+                            urls_list.append(utxt)
+                urls = join_csv(urls_list)
+
+                nv_list: List[str] = []
+                nv_elem = elem.find("namevariations")
+                if nv_elem is not None:
+                    for n in nv_elem.findall("name"):
+                        ntxt = text_or_none(n.text)
+                        if ntxt:
+                            nv_list.append(ntxt)
+                namevariations = join_csv(nv_list)
+
+                aliases_list: List[str] = []
+                aliases_elem = elem.find("aliases")
+                if aliases_elem is not None:
+                    for a in aliases_elem.findall("name"):
+                        atxt = text_or_none(a.text)
+                        if atxt:
+                            aliases_list.append(atxt)
+                aliases = join_csv(aliases_list)
+
+                row = (artist_id, name, realname, profile, data_quality, urls, namevariations, aliases)
+                for col, value in zip(columns, row):
+                    col.append(value)
+
+                if len(columns[0]) >= batch:
+                    flush()
+                    if max_parts is not None and batches >= max_parts:
+                        print(f"🧪 max-parts reached ({args.max_parts}), stopping early.")
+                        break
+
+        flush()
+    finally:
+        writer.close()
 
     if args.typed:
-        print(f"✅ Done. Parts written: {part}  Output: {out_dir}")
-        print(f"📊 artists_v1_typed: written={written_total:,} dropped_non_numeric_artist_id={dropped_total:,}")
+        print(f"✅ Done. Parts written: {writer.part}  Output: {out_dir}")
+        print(f"📊 artists_v1_typed: written={writer.rows_written:,} dropped_non_numeric_artist_id={dropped_total:,}")
     else:
-        print(f"✅ Done. Parts written: {part}  Output: {out_dir}")
+        print(f"✅ Done. Parts written: {writer.part}  Output: {out_dir}")
 
     return 0
 
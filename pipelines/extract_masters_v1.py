@@ -18,38 +18,43 @@ ENV vars:
 from __future__ import annotations
 
 import argparse
-import gzip
 import os
 import sys
 import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Any
 
-import pandas as pd
+from _pipeline_io import (
+    MASTERS_COLUMNS,
+    MASTERS_DICTIONARY_COLUMNS,
+    MASTERS_INT_COLUMNS_LEGACY,
+    MASTERS_INT_COLUMNS_TYPED,
+    PartWriter,
+    open_dump,
+    pause_gc,
+    preferred_engine,
+)
+
+
+OUTPUT_COLUMNS: List[str] = MASTERS_COLUMNS
 
 
 def text_or_none(x) -> Optional[str]:
     if x is None:
         return None
-    s = str(x).strip()
+    s = x.strip()
     return s or None
 
 
-def parquet_engine_preferred() -> str:
-    try:
-        import pyarrow  # noqa: F401
-        return "pyarrow"
-    except Exception:
-        return "fastparquet"
-
-
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Extract Discogs masters dump to Parquet.")
     p.add_argument("--src", help="Path to masters XML dump (*.xml.gz). Overrides DISCOGS_MASTERS_DUMP.")
     p.add_argument("--out", help="Output dir override.")
-    p.add_argument("--batch", type=int, default=50_000, help="Rows per Parquet part (default: 50000).")
+    p.add_argument("--batch", type=int, default=50_000, help="Rows per record batch / row group (default: 50000).")
+    p.add_argument("--rows-per-file", type=int, default=1_000_000,
+                   help="Roll to a new Parquet file after N rows (default: 1000000).")
     p.add_argument("--engine", choices=["pyarrow", "fastparquet"], default=None, help="Parquet engine override.")
-    p.add_argument("--max-parts", type=int, default=None, help="Stop after writing N parts (debug).")
+    p.add_argument("--max-parts", type=int, default=None, help="Stop after writing N batches (debug).")
     p.add_argument("--clean", action="store_true", help="Delete existing *.parquet in output dir before writing.")
     p.add_argument("--typed", action="store_true", help="Write typed IDs (master_id/main_release_id BIGINT) to masters_v1_typed.")
     return p.parse_args()
@@ -79,9 +84,12 @@ def join_csv(values: List[str], sep: str = ", ") -> Optional[str]:
     return sep.join(values) if values else None
 
 
-def safe_int(x: Optional[str]) -> Optional[int]:
-    if x is None:
+def to_int_or_none(x: Optional[str]) -> Optional[int]:
+    if not x:
         return None
+    # fast path: plain digits never raise; int() still handles signs/whitespace
+    if x.isdecimal():
+        return int(x)
     try:
         return int(x)
     except ValueError:
@@ -106,139 +114,141 @@ def main() -> int:
         if old:
             print(f"🧹 Cleaned {len(old)} parquet files in {out_dir}")
 
-    engine = args.engine or parquet_engine_preferred()
+    engine = args.engine or preferred_engine()
     batch = int(args.batch)
 
     print(f"📥 Source:  {src}")
     print(f"📦 Output:  {out_dir}")
-    print(f"⚙️  batch={batch} engine={engine} clean={bool(args.clean)} typed={bool(args.typed)}")
+    print(f"⚙️  batch={batch} rows_per_file={args.rows_per_file} engine={engine} clean={bool(args.clean)} typed={bool(args.typed)}")
 
-    rows: List[Dict[str, Any]] = []
-    part = 0
+    batches = 0
+    dropped_batch = 0
     dropped_total = 0
-    written_total = 0
+
+    writer = PartWriter(
+        out_dir,
+        OUTPUT_COLUMNS,
+        MASTERS_INT_COLUMNS_TYPED if args.typed else MASTERS_INT_COLUMNS_LEGACY,
+        engine=engine,
+        rows_per_file=args.rows_per_file,
+        dictionary_columns=MASTERS_DICTIONARY_COLUMNS,
+    )
+
+    # Column-oriented buffer (Arrow string builders on pyarrow);
+    # typed IDs and year are parsed to int at append time
+    columns = writer.new_buffers()
 
     def flush() -> None:
-        nonlocal rows, part, dropped_total, written_total
-        if not rows:
+        nonlocal batches, dropped_batch, dropped_total
+        if dropped_batch:
+            print(f"⚠️  masters_v1_typed: dropping {dropped_batch:,} rows with non-numeric master_id (batch)")
+            dropped_total += dropped_batch
+            dropped_batch = 0
+
+        if not columns[0]:
             return
 
-        df = pd.DataFrame(
-            rows,
-            columns=[
-                "master_id",
-                "main_release_id",
-                "title",
-                "year",
-                "master_artists",
-                "master_artist_ids",
-                "genres",
-                "styles",
-                "data_quality",
-            ],
-        )
-
-        # year stays numeric
-        df["year"] = pd.to_numeric(df["year"], errors="coerce").astype("Int64")
-
-        dropped_batch = 0
-        if args.typed:
-            df["master_id"] = pd.to_numeric(df["master_id"], errors="coerce").astype("Int64")
-            df["main_release_id"] = pd.to_numeric(df["main_release_id"], errors="coerce").astype("Int64")
-
-            dropped_batch = int(df["master_id"].isna().sum())
-            if dropped_batch:
-                print(f"⚠️  masters_v1_typed: dropping {dropped_batch:,} rows with non-numeric master_id (batch)")
-
-            # master_id is mandatory for typed dataset
-            df = df[df["master_id"].notna()]
-
-        out_file = out_dir / f"part-{part:05d}.parquet"
-        df.to_parquet(out_file, engine=engine, index=False)
-
-        written = len(df)
-        written_total += written
-        dropped_total += dropped_batch
-
-        print(f"💾 Written {written:,} rows → {out_file.name}")
-
-        rows = []
-        part += 1
-
-    with gzip.open(src, "rb") as f:
-        for event, elem in ET.iterparse(f, events=("end",)):
-            if elem.tag != "master":
-                continue
-
-            master_id = text_or_none(elem.get("id"))
-            main_release_id = text_or_none(elem.findtext("main_release"))
-            title = text_or_none(elem.findtext("title"))
-            year = safe_int(text_or_none(elem.findtext("year")))
-            data_quality = text_or_none(elem.findtext("data_quality"))
-
-            master_artists_list: List[str] = []
-            master_artist_ids_list: List[str] = []
-            artists_elem = elem.find("artists")
-            if artists_elem is not None:
-                for a in artists_elem.findall("artist"):
-                    name = text_or_none(a.findtext("name"))
-                    aid = text_or_none(a.findtext("id"))
-                    if name:
-                        master_artists_list.append(name)
-                    if aid:
-                        master_artist_ids_list.append(aid)
-
-            master_artists = join_csv(master_artists_list, sep=", ")
-            master_artist_ids = join_csv(master_artist_ids_list, sep=",")
-
-            genres_list: List[str] = []
-            genres_elem = elem.find("genres")
-            if genres_elem is not None:
-                for g in genres_elem.findall("genre"):
-                    gtxt = text_or_none(g.text)
-                    if gtxt:
-                        genres_list.append(gtxt)
-            genres = join_csv(genres_list, sep=", ")
-
-            styles_list: List[str] = []
-            styles_elem = elem.find("styles")
-            if styles_elem is not None:
-                for s in styles_elem.findall("style"):
-                    stxt = text_or_none(s.text)
-                    if stxt:
-                        styles_list.append(stxt)
-            styles = join_csv(styles_list, sep=", ")
-
-            rows.append(
-                {
-                    "master_id": master_id,
-                    "main_release_id": main_release_id,
-                    "title": title,
-                    "year": year,
-                    "master_artists": master_artists,
-                    "master_artist_ids": master_artist_ids,
-                    "genres": genres,
-                    "styles": styles,
-                    "data_quality": data_quality,
-                }
-            )
-
-            if len(rows) >= batch:
-                flush()
-                if args.max_parts is not None and part >= args.max_parts:
-                    print(f"🧪 max-parts reached ({args.max_parts}), stopping early.")
-                    elem.clear()
-                    break
-
-            elem.clear()
-
-    flush()
+        writer.write(columns)
+        batches += 1
+
+    # per-record hot loop reads locals, not argparse attributes
+    typed = bool(args.typed)
+    max_parts = args.max_parts
+
+    pause_gc()
+    try:
+        with open_dump(src) as f:
+            # start events give us the root; clearing it drops processed records
+            # that the root would otherwise keep referencing for the whole run
+            context = ET.iterparse(f, events=("start", "end"))
+            _, root = next(context)
+
+            for event, elem in context:
+                if event != "end" or elem.tag != "master":
+                    continue
+
+                master_id: Any = text_or_none(elem.get("id"))
+                main_release_id: Any = text_or_none(elem.findtext("main_release"))
+                if typed:
+                    # master_id is mandatory for typed dataset
+                    master_id = to_int_or_none(master_id)
+                    if master_id is None:
+                        dropped_batch += 1
+                        elem.clear()
+                        root.clear()
+                        continue
+                    main_release_id = to_int_or_none(main_release_id)
+
+                title = text_or_none(elem.findtext("title"))
+                year = to_int_or_none(elem.findtext("year"))
+                data_quality = text_or_none(elem.findtext("data_quality"))
+
+                master_artists_list: List[str] = []
+                master_artist_ids_list: List[str] = []
+                artists_elem = elem.find("artists")
+                if artists_elem is not None:
+                    for a in artists_elem.findall("artist"):
+                        name = text_or_none(a.findtext("name"))
+                        aid = text_or_none(a.findtext("id"))
+                        if name:
+                            master_artists_list.append(name)
+                        if aid:
+                            master_artist_ids_list.append(aid)
+
+                master_artists = join_csv(master_artists_list, sep=", ")
+                master_artist_ids = join_csv(master_artist_ids_list, sep=",")
+
+                genres_list: List[str] = []
+                genres_elem = elem.find("genres")
+                if genres_elem is not None:
+                    for g in genres_elem.findall("genre"):
+                        gtxt = text_or_none(g.text)
+                        if gtxt:
+                            genres_list.append(gtxt)
+                genres = join_csv(genres_list, sep=", ")
+
+                styles_list: List[str] = []
+                styles_elem = elem.find("styles")
+                if styles_elem is not None:
+                    for s in styles_elem.findall("style"):
+                        stxt = text_or_none(s.text)
+                        if stxt:
+                            styles_list.append(stxt)
+                styles = join_csv(styles_list, sep=", ")
+
+                row = (
+                    master_id,
+                    main_release_id,
+                    title,
+                    year,
+                    master_artists,
+                    master_artist_ids,
+                    genres,
+                    styles,
+                    data_quality,
+                )
+                for col, value in zip(columns, row):
+                    col.append(value)
+
+                if len(columns[0]) >= batch:
+                    flush()
+                    if max_parts is not None and batches >= max_parts:
+                        print(f"🧪 max-parts reached ({args.max_parts}), stopping early.")
+                        elem.clear()
+                        break
+
+                elem.clear()
+                root.clear()
+
+        flush()
+    finally:
+        writer.close()
 
     if args.typed:
-        print(f"✅ Done. Parts written: {part}  Output: {out_dir}")
-        print(f"📊 masters_v1_typed: written={written_total:,} dropped_non_numeric_master_id={dropped_total:,}")
+        print(f"✅ Done. Parts written: {writer.part}  Output: {out_dir}")
+        print(f"📊 masters_v1_typed: written={writer.rows_written:,} dropped_non_numeric_master_id={dropped_total:,}")
     else:
-        print(f"✅ Done. Parts written: {part}  Output: {out_dir}")
+        print(f"✅ Done. Parts written: {writer.part}  Output: {out_dir}")
 
     return 0
 
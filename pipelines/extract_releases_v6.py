@@ -7,48 +7,42 @@ hive.discogs.releases_ref_v6
 
 Key guarantees:
 - Text fields are always str or None (never bytes), so schema stays VARCHAR in DuckDB/Trino.
-- Output schema is declared ONCE at the top (scalable + maintainable).
+- Output schema is declared ONCE (_pipeline_io.RELEASES_COLUMNS / SCHEMA_RELEASES).
 """
 
 from __future__ import annotations
 
 import argparse
-import gzip
 import os
 import sys
-import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Optional, Dict, Any, List
-
-import pandas as pd
+from typing import Optional, Dict, Any, Iterable, List
+
+try:
+    from lxml import etree as ET
+    HAS_LXML = True
+except ImportError:  # stdlib fallback (slower, no tag= filter)
+    import xml.etree.ElementTree as ET
+    HAS_LXML = False
+
+from _pipeline_io import (
+    RELEASES_COLUMNS,
+    RELEASES_DICTIONARY_COLUMNS,
+    RELEASES_INT_COLUMNS,
+    PartWriter,
+    open_dump,
+    pause_gc,
+    preferred_engine,
+)
 
 
 # ============================================================
-# Output schema (DECLARE ONCE)
+# Output schema (DECLARE ONCE, in _pipeline_io)
 # ============================================================
 
-OUTPUT_COLUMNS: List[str] = [
-    "release_id",
-    "master_id",
-    "title",
-    "artists",
-    "labels",
-    "label_catnos",
-    "country",
-    "formats",
-    "genres",
-    "styles",
-    "credits_flat",
-    "status",
-    "released",
-    "data_quality",
-    "format_qtys",
-    "format_texts",
-    "format_descriptions",
-    "identifiers_flat",
-]
+OUTPUT_COLUMNS: List[str] = RELEASES_COLUMNS
 
-ID_COLUMNS: List[str] = ["release_id", "master_id"]
+ID_COLUMNS: List[str] = [c for c in OUTPUT_COLUMNS if c in RELEASES_INT_COLUMNS]
 
 TEXT_COLUMNS: List[str] = [
     c for c in OUTPUT_COLUMNS if c not in ID_COLUMNS
@@ -66,6 +60,8 @@ def safe_text(x) -> Optional[str]:
     - bytes are decoded as UTF-8 with replacement
     - everything else is str()'d
     """
+    if type(x) is str:  # fast path: parser text/attributes
+        return x.strip() or None
     if x is None:
         return None
     if isinstance(x, bytes):
@@ -79,21 +75,387 @@ def safe_text(x) -> Optional[str]:
     return s or None
 
 
-def join_csv(items: List[Any]) -> Optional[str]:
-    out: List[str] = []
-    for it in items:
-        s = safe_text(it)
-        if s:
-            out.append(s)
-    return ", ".join(out) if out else None
+def join_csv(items: Iterable[Any]) -> Optional[str]:
+    """Join the non-empty cleaned values with ", " (None if there are none). Takes any iterable."""
+    return ", ".join(filter(None, map(safe_text, items))) or None
+
+
+def intern_or_none(s: Optional[str]) -> Optional[str]:
+    """
+    Intern a cleaned value from a low-cardinality field (country, status,
+    data_quality, format names): every row then shares one str object
+    instead of allocating its own copy.
+    """
+    return sys.intern(s) if s else None
 
 
-def parquet_engine_preferred() -> str:
+def to_int_or_none(x: Optional[str]) -> Optional[int]:
+    if not x:
+        return None
+    # fast path: plain digits never raise; int() still handles signs/whitespace
+    if x.isdecimal():
+        return int(x)
     try:
-        import pyarrow  # noqa: F401
-        return "pyarrow"
-    except Exception:
-        return "fastparquet"
+        return int(x)
+    except ValueError:
+        return None
+
+
+def compile_path(path: str):
+    """
+    Child-path query compiled once: an lxml XPath object, or (stdlib) a
+    findall() wrapper with the same call shape. Returns a list of elements.
+    """
+    if HAS_LXML:
+        return ET.XPath(path)
+    return lambda elem: elem.findall(path)
+
+
+ARTISTS_XP = compile_path("artists/artist")
+LABELS_XP = compile_path("labels/label")
+FORMATS_XP = compile_path("formats/format")
+DESCRIPTIONS_XP = compile_path("descriptions/description")
+GENRES_XP = compile_path("genres/genre")
+STYLES_XP = compile_path("styles/style")
+EXTRAARTISTS_XP = compile_path("extraartists/artist")
+IDENTIFIERS_XP = compile_path("identifiers/identifier")
+
+# Direct children of <release> read as plain text
+SCALAR_TAGS = frozenset({"master_id", "title", "country", "status", "released", "data_quality"})
+
+
+def credit_text(name: Optional[str], role: Optional[str]) -> Optional[str]:
+    """One extraartist → "role: name" (or whichever of the two is present)."""
+    nm = safe_text(name)
+    rl = safe_text(role)
+    if rl and nm:
+        return f"{rl}: {nm}"
+    return nm or rl
+
+
+def identifier_text(t: Optional[str], desc: Optional[str], val: Optional[str]) -> Optional[str]:
+    """One identifier (already cleaned parts) → "type [description] : value"."""
+    if not (t or desc or val):
+        return None
+    head = t or ""
+    if desc:
+        head = f"{head} [{desc}]".strip()
+    return (f"{head} : {val}".strip() if val else head.strip()) or None
+
+
+def _credit(ac) -> Optional[str]:
+    return credit_text(ac.findtext("name"), ac.findtext("role"))
+
+
+def _identifier(ident) -> Optional[str]:
+    return identifier_text(
+        safe_text(ident.get("type")),
+        safe_text(ident.get("description")),
+        safe_text(ident.get("value")) or safe_text(ident.text),
+    )
+
+
+# ============================================================
+# Release row builder (generated from a field table)
+# ============================================================
+#
+# One entry per OUTPUT_COLUMNS column, in order: (column, kind, source).
+# `source` is a Python expression over the locals of the generated function:
+#   elem           the <release> element
+#   sc             first text per SCALAR_TAGS child (one pass over children)
+#   labels_nodes   LABELS_XP(elem)
+#   formats_nodes  FORMATS_XP(elem)
+# kind:
+#   "int"     to_int_or_none(safe_text(source))
+#   "text"    safe_text(source)
+#   "intern"  intern_or_none(safe_text(source))
+#   "expr"    source as is (already str/None)
+#   "iexpr"   intern_or_none(source)
+RELEASE_FIELDS: List[tuple] = [
+    ("release_id", "int", 'elem.get("id")'),
+    ("master_id", "int", 'sc.get("master_id")'),
+    ("title", "text", 'sc.get("title")'),
+    ("artists", "expr", 'join_csv(a.findtext("name") for a in ARTISTS_XP(elem))'),
+    ("labels", "expr", 'join_csv(l.get("name") for l in labels_nodes)'),
+    ("label_catnos", "expr", 'join_csv(l.get("catno") for l in labels_nodes)'),
+    ("country", "intern", 'sc.get("country")'),
+    ("formats", "iexpr", 'join_csv(fmt.get("name") for fmt in formats_nodes)'),
+    ("genres", "expr", "join_csv(g.text for g in GENRES_XP(elem))"),
+    ("styles", "expr", "join_csv(s.text for s in STYLES_XP(elem))"),
+    ("credits_flat", "expr", '"; ".join(filter(None, map(_credit, EXTRAARTISTS_XP(elem)))) or None'),
+    ("status", "intern", 'sc.get("status")'),
+    ("released", "text", 'sc.get("released")'),
+    ("data_quality", "intern", 'sc.get("data_quality")'),
+    ("format_qtys", "expr", 'join_csv(fmt.get("qty") for fmt in formats_nodes)'),
+    ("format_texts", "expr", 'join_csv(fmt.get("text") for fmt in formats_nodes)'),
+    ("format_descriptions", "expr", "join_csv(d.text for fmt in formats_nodes for d in DESCRIPTIONS_XP(fmt))"),
+    ("identifiers_flat", "expr", '"; ".join(filter(None, map(_identifier, IDENTIFIERS_XP(elem)))) or None'),
+]
+
+# Text from lxml/ElementTree is always str here, so safe_text() inlines to a
+# strip (via a walrus temp) and skips the call + isinstance(bytes) check.
+_FIELD_TEMPLATES = {
+    "int": "(to_int_or_none(_v.strip()) if (_v := {src}) else None)",
+    "text": "((_v.strip() or None) if (_v := {src}) else None)",
+    "intern": "(sys_intern(_v) if (_v := {src}) and (_v := _v.strip()) else None)",
+    "expr": "{src}",
+    "iexpr": "(sys_intern(_v) if (_v := {src}) else None)",
+}
+
+# Globals the generated code uses, bound as default args (LOAD_FAST, not LOAD_GLOBAL)
+_BUILDER_LOCALS = (
+    "SCALAR_TAGS", "to_int_or_none", "join_csv", "sys_intern", "_credit", "_identifier",
+    "ARTISTS_XP", "LABELS_XP", "FORMATS_XP", "DESCRIPTIONS_XP", "GENRES_XP", "STYLES_XP",
+    "EXTRAARTISTS_XP", "IDENTIFIERS_XP",
+)
+
+
+def build_release_extractor(fields: List[tuple] = RELEASE_FIELDS):
+    """
+    Generate extract_release(elem) for the fixed release schema: every field
+    inlined into one tuple expression, helpers as fast locals.
+    Returns (function, source).
+    """
+    got = [c for c, _, _ in fields]
+    if got != OUTPUT_COLUMNS:
+        raise ValueError(f"RELEASE_FIELDS out of sync with OUTPUT_COLUMNS: {got}")
+
+    params = ", ".join(f"{n}={n}" for n in _BUILDER_LOCALS)
+    items = "".join(
+        f"        {_FIELD_TEMPLATES[kind].format(src=src)},  # {col}\n" for col, kind, src in fields
+    )
+    source = (
+        f"def extract_release(elem, *, {params}):\n"
+        "    sc = {}\n"
+        "    for child in elem:\n"
+        "        tag = child.tag\n"
+        "        if tag in SCALAR_TAGS and tag not in sc:\n"
+        "            sc[tag] = child.text\n"
+        "    labels_nodes = LABELS_XP(elem)\n"
+        "    formats_nodes = FORMATS_XP(elem)\n"
+        "    return (\n"
+        f"{items}"
+        "    )\n"
+    )
+    namespace = dict(globals(), sys_intern=sys.intern)
+    exec(compile(source, "<extract_release>", "exec"), namespace)
+    fn = namespace["extract_release"]
+    fn.__doc__ = "Extract one <release> element into a row tuple ordered as OUTPUT_COLUMNS (generated)."
+    return fn, source
+
+
+extract_release, EXTRACT_RELEASE_SOURCE = build_release_extractor()
+
+
+class ReleaseTarget:
+    """
+    Parser target (start/end/data/close) producing the same row tuples as
+    extract_release(), without building an element tree.
+
+    Only text of the paths listed in TEXT_PATHS is collected; everything else
+    (tracklist, videos, companies, notes, ...) is skipped as it streams by.
+    Works with xml.etree.ElementTree.XMLParser and lxml.etree.XMLParser.
+    """
+
+    # Paths relative to <release> whose .text we need
+    TEXT_PATHS = {
+        ("master_id",),
+        ("title",),
+        ("country",),
+        ("status",),
+        ("released",),
+        ("data_quality",),
+        ("artists", "artist", "name"),
+        ("formats", "format", "descriptions", "description"),
+        ("genres", "genre"),
+        ("styles", "style"),
+        ("extraartists", "artist", "name"),
+        ("extraartists", "artist", "role"),
+        ("identifiers", "identifier"),
+    }
+
+    SCALARS = SCALAR_TAGS
+
+    def __init__(self) -> None:
+        self.rows: List[tuple] = []
+        self._path: List[str] = []      # tags below <release>
+        self._in_release = False
+        self._bufs: List[Optional[List[str]]] = []
+        self._buf: Optional[List[str]] = None
+        self._reset()
+
+    def _reset(self) -> None:
+        self._id: Optional[str] = None
+        self._scalars: Dict[str, Optional[str]] = {}
+        self._artists: List[Optional[str]] = []
+        self._label_names: List[Optional[str]] = []
+        self._label_catnos: List[Optional[str]] = []
+        self._format_names: List[str] = []
+        self._format_qtys: List[str] = []
+        self._format_texts: List[str] = []
+        self._format_descs: List[str] = []
+        self._genres: List[Optional[str]] = []
+        self._styles: List[Optional[str]] = []
+        self._credits: List[str] = []
+        self._identifiers: List[str] = []
+        self._person: Dict[str, Optional[str]] = {}
+        self._ident_attrs: Dict[str, str] = {}
+
+    def start(self, tag, attrs) -> None:
+        # .text is the data before the first child: stop collecting the parent
+        self._buf = None
+
+        if not self._in_release:
+            if tag == "release":
+                self._in_release = True
+                self._id = attrs.get("id")
+            return
+
+        path = self._path
+        path.append(tag)
+        p = tuple(path)
+
+        buf: Optional[List[str]] = [] if p in self.TEXT_PATHS else None
+        self._bufs.append(buf)
+        self._buf = buf
+
+        if p == ("artists", "artist") or p == ("extraartists", "artist"):
+            self._person = {}
+        elif p == ("labels", "label"):
+            self._label_names.append(attrs.get("name"))
+            self._label_catnos.append(attrs.get("catno"))
+        elif p == ("formats", "format"):
+            nm = safe_text(attrs.get("name"))
+            qt = safe_text(attrs.get("qty"))
+            tx = safe_text(attrs.get("text"))
+            if nm: self._format_names.append(nm)
+            if qt: self._format_qtys.append(qt)
+            if tx: self._format_texts.append(tx)
+        elif p == ("identifiers", "identifier"):
+            self._ident_attrs = attrs
+
+    def data(self, s) -> None:
+        if self._buf is not None:
+            self._buf.append(s)
+
+    def end(self, tag) -> None:
+        # tail text is never collected
+        self._buf = None
+
+        if not self._in_release:
+            return
+
+        path = self._path
+        if not path:
+            # </release>
+            self.rows.append(self._row())
+            self._in_release = False
+            self._reset()
+            return
+
+        p = tuple(path)
+        buf = self._bufs.pop()
+        path.pop()
+        text = "".join(buf) if buf is not None else None
+
+        if len(p) == 1:
+            if tag in self.SCALARS:
+                # findtext(): first match wins
+                self._scalars.setdefault(tag, text)
+        elif p == ("artists", "artist", "name") or p == ("extraartists", "artist", "name"):
+            self._person.setdefault("name", text)
+        elif p == ("extraartists", "artist", "role"):
+            self._person.setdefault("role", text)
+        elif p == ("artists", "artist"):
+            self._artists.append(self._person.get("name"))
+        elif p == ("extraartists", "artist"):
+            credit = credit_text(self._person.get("name"), self._person.get("role"))
+            if credit:
+                self._credits.append(credit)
+        elif p == ("formats", "format", "descriptions", "description"):
+            desc = safe_text(text)
+            if desc:
+                self._format_descs.append(desc)
+        elif p == ("genres", "genre"):
+            self._genres.append(text)
+        elif p == ("styles", "style"):
+            self._styles.append(text)
+        elif p == ("identifiers", "identifier"):
+            attrs = self._ident_attrs
+            ident = identifier_text(
+                safe_text(attrs.get("type")),
+                safe_text(attrs.get("description")),
+                safe_text(attrs.get("value")) or safe_text(text),
+            )
+            if ident:
+                self._identifiers.append(ident)
+
+    def close(self) -> None:
+        return None
+
+    def _row(self) -> tuple:
+        sc = self._scalars
+        return (
+            to_int_or_none(safe_text(self._id)),
+            to_int_or_none(safe_text(sc.get("master_id"))),
+            safe_text(sc.get("title")),
+            join_csv(self._artists),
+            join_csv(self._label_names),
+            join_csv(self._label_catnos),
+            intern_or_none(safe_text(sc.get("country"))),
+            intern_or_none(join_csv(self._format_names)),
+            join_csv(self._genres),
+            join_csv(self._styles),
+            "; ".join(self._credits) if self._credits else None,
+            intern_or_none(safe_text(sc.get("status"))),
+            safe_text(sc.get("released")),
+            intern_or_none(safe_text(sc.get("data_quality"))),
+            join_csv(self._format_qtys),
+            join_csv(self._format_texts),
+            join_csv(self._format_descs),
+            "; ".join(self._identifiers) if self._identifiers else None,
+        )
+
+
+def iter_release_rows_target(f, chunk_size: int = 1 << 20):
+    """Feed the (decompressed) stream to a ReleaseTarget in fixed-size chunks."""
+    target = ReleaseTarget()
+    parser = ET.XMLParser(target=target, huge_tree=True) if HAS_LXML else ET.XMLParser(target=target)
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        parser.feed(chunk)
+        if target.rows:
+            yield from target.rows
+            target.rows.clear()
+    parser.close()
+    yield from target.rows
+    target.rows.clear()
+
+
+def iter_releases_iterparse(f):
+    """Yield each <release> element; frees it (and already-seen siblings) once consumed."""
+    if HAS_LXML:
+        # tag= filters in C: only </release> events reach Python
+        for _, elem in ET.iterparse(f, events=("end",), tag="release", huge_tree=True):
+            yield elem
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        return
+
+    # start events give us the root; clearing it drops processed
+    # releases that the root would otherwise keep for the whole run
+    context = ET.iterparse(f, events=("start", "end"))
+    _, root = next(context)
+
+    for event, elem in context:
+        if event != "end" or elem.tag != "release":
+            continue
+        yield elem
+        elem.clear()
+        root.clear()
 
 
 def resolve_paths(src_arg: Optional[str], out_arg: Optional[str]) -> tuple[Path, Path]:
@@ -120,10 +482,14 @@ def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Extract Discogs releases dump into Parquet dataset releases_v6.")
     p.add_argument("--src", help="Path to Discogs releases XML dump (*.xml.gz). Overrides DISCOGS_RELEASES_DUMP.")
     p.add_argument("--out", help="Output directory for Parquet parts. Default: $DISCOGS_DATA_LAKE/releases_v6")
-    p.add_argument("--batch", type=int, default=50_000, help="Rows per Parquet part (default: 50000).")
+    p.add_argument("--batch", type=int, default=50_000, help="Rows per record batch / row group (default: 50000).")
+    p.add_argument("--rows-per-file", type=int, default=1_000_000,
+                   help="Roll to a new Parquet file after N rows (default: 1000000).")
     p.add_argument("--engine", choices=["pyarrow", "fastparquet"], default=None, help="Parquet engine override.")
-    p.add_argument("--max-parts", type=int, default=None, help="Stop after writing N parts (debug).")
+    p.add_argument("--max-parts", type=int, default=None, help="Stop after writing N batches (debug).")
     p.add_argument("--clean", action="store_true", help="Delete existing parquet files in output dir before writing.")
+    p.add_argument("--parser", choices=["iterparse", "target"], default="iterparse",
+                   help="XML parsing strategy: iterparse (default) or target (callback parser, no element tree).")
     return p.parse_args()
 
 
@@ -145,155 +511,67 @@ def main() -> int:
         for p in out_dir.glob("*.parquet"):
             p.unlink()
 
-    engine = args.engine or parquet_engine_preferred()
-
-    rows: List[Dict[str, Any]] = []
-    part = 0
-
-    def flush() -> None:
-        nonlocal rows, part
-        if not rows:
-            return
+    engine = args.engine or preferred_engine()
 
-        df = pd.DataFrame(rows, columns=OUTPUT_COLUMNS)
+    batches = 0
 
-        # IDs → numeric nullable
-        for c in ID_COLUMNS:
-            df[c] = pd.to_numeric(df[c], errors="coerce").astype("Int64")
+    # one file per --rows-per-file rows, each batch one row group (pyarrow or fastparquet)
+    writer = PartWriter(
+        out_dir,
+        OUTPUT_COLUMNS,
+        RELEASES_INT_COLUMNS,
+        engine=engine,
+        rows_per_file=args.rows_per_file,
+        file_pattern="releases_part{part:04d}.parquet",
+        dictionary_columns=RELEASES_DICTIONARY_COLUMNS,
+    )
 
-        # Text columns → force string/None (prevents DuckDB inferring BLOB)
-        for c in TEXT_COLUMNS:
-            df[c] = df[c].map(safe_text).astype("string")
+    # Column-oriented buffer, one per OUTPUT_COLUMNS entry (Arrow string builders on pyarrow)
+    columns = writer.new_buffers()
 
-        out_file = out_dir / f"releases_part{part:04d}.parquet"
-        df.to_parquet(out_file, engine=engine, index=False)
-        print(f"🧱 written {out_file.name}  ({len(df):,} rows)")
+    def flush() -> None:
+        nonlocal batches
+        if not columns[0]:
+            return
 
-        rows.clear()
-        part += 1
+        # IDs are already int/None, text is already str/None (see extract_release).
+        writer.write(columns)
+        batches += 1
 
     print(f"📥 Source: {src}")
     print(f"📦 Output: {out_dir}")
     print(f"📐 Columns: {len(OUTPUT_COLUMNS)} (IDs={len(ID_COLUMNS)}, text={len(TEXT_COLUMNS)})")
-    print(f"⚙️  batch={args.batch} engine={engine}")
-
-    with gzip.open(src, "rb") as f:
-        for event, elem in ET.iterparse(f, events=("end",)):
-            if elem.tag != "release":
-                continue
-
-            release_id = safe_text(elem.get("id"))
-            master_id = safe_text(elem.findtext("master_id"))
-            title = safe_text(elem.findtext("title"))
-            country = safe_text(elem.findtext("country"))
-            status = safe_text(elem.findtext("status"))
-            released = safe_text(elem.findtext("released"))
-            data_quality = safe_text(elem.findtext("data_quality"))
-
-            # Artists
-            artists_nodes = elem.findall("artists/artist")
-            artists = join_csv([a.findtext("name") for a in artists_nodes])
-
-            # Labels + catnos
-            labels_nodes = elem.findall("labels/label")
-            labels = join_csv([l.get("name") for l in labels_nodes])
-            label_catnos = join_csv([l.get("catno") for l in labels_nodes])
-
-            # Formats + qty/text/descriptions
-            format_names: List[str] = []
-            format_qtys: List[str] = []
-            format_texts: List[str] = []
-            format_descs: List[str] = []
-
-            for fmt in elem.findall("formats/format"):
-                nm = safe_text(fmt.get("name"))
-                qt = safe_text(fmt.get("qty"))
-                tx = safe_text(fmt.get("text"))
-
-                if nm: format_names.append(nm)
-                if qt: format_qtys.append(qt)
-                if tx: format_texts.append(tx)
-
-                for d in fmt.findall("descriptions/description"):
-                    desc = safe_text(d.text)
-                    if desc:
-                        format_descs.append(desc)
-
-            formats = join_csv(format_names)
-            format_qtys_str = join_csv(format_qtys)
-            format_texts_str = join_csv(format_texts)
-            format_descs_str = join_csv(format_descs)
-
-            # Genres / Styles
-            genres = join_csv([g.text for g in elem.findall("genres/genre")])
-            styles = join_csv([s.text for s in elem.findall("styles/style")])
-
-            # Credits (extraartists)
-            credits_pairs: List[str] = []
-            for ac in elem.findall("extraartists/artist"):
-                nm = safe_text(ac.findtext("name"))
-                rl = safe_text(ac.findtext("role"))
-                if rl and nm:
-                    credits_pairs.append(f"{rl}: {nm}")
-                elif nm:
-                    credits_pairs.append(nm)
-                elif rl:
-                    credits_pairs.append(rl)
-            credits_flat = "; ".join(credits_pairs) if credits_pairs else None
-
-            # Identifiers
-            identifier_chunks: List[str] = []
-            for ident in elem.findall("identifiers/identifier"):
-                t = safe_text(ident.get("type"))
-                desc = safe_text(ident.get("description"))
-                val = safe_text(ident.get("value")) or safe_text(ident.text)
-
-                if not (t or desc or val):
-                    continue
-
-                head = t or ""
-                if desc:
-                    head = f"{head} [{desc}]".strip()
-                chunk = f"{head} : {val}".strip() if val else head.strip()
-                if chunk:
-                    identifier_chunks.append(chunk)
-
-            identifiers_flat = "; ".join(identifier_chunks) if identifier_chunks else None
-
-            rows.append(
-                {
-                    "release_id": release_id,
-                    "master_id": master_id,
-                    "title": title,
-                    "artists": artists,
-                    "labels": labels,
-                    "label_catnos": label_catnos,
-                    "country": country,
-                    "formats": formats,
-                    "genres": genres,
-                    "styles": styles,
-                    "credits_flat": credits_flat,
-                    "status": status,
-                    "released": released,
-                    "data_quality": data_quality,
-                    "format_qtys": format_qtys_str,
-                    "format_texts": format_texts_str,
-                    "format_descriptions": format_descs_str,
-                    "identifiers_flat": identifiers_flat,
-                }
-            )
+    print(f"⚙️  batch={args.batch} rows_per_file={args.rows_per_file} engine={engine} parser={args.parser}")
 
-            if len(rows) >= args.batch:
-                flush()
-                if args.max_parts is not None and part >= args.max_parts:
-                    print(f"🧪 max-parts reached ({args.max_parts}), stopping early.")
-                    elem.clear()
-                    break
+    def push(row: tuple) -> bool:
+        """Buffer one row; return True when --max-parts is reached."""
+        for col, value in zip(columns, row):
+            col.append(value)
 
-            elem.clear()
+        if len(columns[0]) >= args.batch:
+            flush()
+            if args.max_parts is not None and batches >= args.max_parts:
+                print(f"🧪 max-parts reached ({args.max_parts}), stopping early.")
+                return True
+        return False
 
-    flush()
-    print(f"✅ Done. Parts written: {part}  Output: {out_dir}")
+    pause_gc()
+    try:
+        with open_dump(src) as f:
+            if args.parser == "target":
+                for row in iter_release_rows_target(f):
+                    if push(row):
+                        break
+            else:
+                for elem in iter_releases_iterparse(f):
+                    if push(extract_release(elem)):
+                        break
+
+        flush()
+    finally:
+        writer.close()
+
+    print(f"✅ Done. Parts written: {writer.part}  Output: {out_dir}")
     return 0
 
 
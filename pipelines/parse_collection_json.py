@@ -35,29 +35,51 @@ from __future__ import annotations
 import argparse
 import glob
 import json
+import mmap
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
-import pandas as pd
+from _pipeline_io import (
+    COLLECTION_COLUMNS,
+    COLLECTION_DICTIONARY_COLUMNS,
+    COLLECTION_INT_COLUMNS,
+    PartWriter,
+    pause_gc,
+    preferred_engine,
+)
+
+# orjson parses straight from bytes and is several times faster than stdlib json
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    orjson = None
+    HAS_ORJSON = False
+
+# Polars (optional, --reader polars): JSON decode + extraction as Rust expressions
+try:
+    import polars as pl
+    HAS_POLARS = True
+except ImportError:
+    pl = None
+    HAS_POLARS = False
+
+# Pages above this size are parsed from an mmap instead of a read() copy
+MMAP_MIN_BYTES = 256 << 20
 
 
 def text_or_none(x: Any) -> Optional[str]:
+    if type(x) is str:  # fast path: JSON strings
+        return x.strip() or None
     if x is None:
         return None
     s = str(x).strip()
     return s or None
 
 
-def parquet_engine_preferred() -> str:
-    try:
-        import pyarrow  # noqa: F401
-        return "pyarrow"
-    except Exception:
-        return "fastparquet"
-
-
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Parse Discogs collection JSON pages to Parquet dataset (collection).")
     p.add_argument("--src-dir", help="Directory containing JSON pages. Overrides DISCOGS_COLLECTION_JSON.")
@@ -66,6 +88,18 @@ def parse_args() -> argparse.Namespace:
     p.add_argument("--chunk", type=int, default=20_000, help="Rows per Parquet part (default: 20000).")
     p.add_argument("--engine", choices=["pyarrow", "fastparquet"], default=None, help="Parquet engine override.")
     p.add_argument("--max-parts", type=int, default=None, help="Stop after writing N parts (debug).")
+    p.add_argument(
+        "--reader",
+        choices=["python", "polars"],
+        default="python",
+        help="Page parser: python (default) or polars (needs polars; runs in-process, polars is multithreaded).",
+    )
+    p.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Processes parsing JSON pages in parallel (default: CPU count; 1 = in-process).",
+    )
     return p.parse_args()
 
 
@@ -82,9 +116,21 @@ def resolve_paths(src_dir_arg: Optional[str], pattern_arg: Optional[str], out_ar
     return src_dir, pattern, out_dir
 
 
+def load_json(path: Path) -> Any:
+    if not HAS_ORJSON:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    with path.open("rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size < MMAP_MIN_BYTES:
+            return orjson.loads(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            return orjson.loads(view)
+
+
 def load_items(path: Path) -> List[Dict[str, Any]]:
-    with path.open("r", encoding="utf-8") as f:
-        data = json.load(f)
+    data = load_json(path)
 
     if isinstance(data, dict) and isinstance(data.get("items"), list):
         return data["items"]
@@ -117,22 +163,215 @@ def join_values(arr: Any) -> Optional[str]:
 
 
 def to_int_or_none(x: Any) -> Optional[int]:
-    if x is None:
-        return None
-    # Allow ints, numeric strings, etc.
-    if isinstance(x, bool):
-        return None
-    if isinstance(x, int):
+    # Allow ints, numeric strings, etc. (bool is not int here: type() check)
+    if type(x) is int:
         return x
-    s = str(x).strip()
-    if not s:
+    if x is None or isinstance(x, bool):
         return None
-    if s.isdigit():
-        try:
-            return int(s)
-        except ValueError:
-            return None
-    return None
+    s = x.strip() if type(x) is str else str(x).strip()
+    # isdecimal(): exactly the strings int() accepts without signs/underscores
+    return int(s) if s.isdecimal() else None
+
+
+def item_to_row(it: Dict[str, Any]) -> tuple:
+    """One collection item → row values in COLLECTION_COLUMNS order."""
+    d = it.get("basic_information", {})
+    if not isinstance(d, dict):
+        d = {}
+
+    instance_id = it.get("id") or it.get("instance_id") or d.get("instance_id")
+    release_id = d.get("id") or it.get("release_id")
+
+    title = d.get("title")
+    year = d.get("year")
+    genres = d.get("genres")
+    styles = d.get("styles")
+    labels = d.get("labels")
+    artists = d.get("artists")
+    formats = d.get("formats")
+    date_added = it.get("date_added") or d.get("date_added")
+
+    rating = (
+        it.get("rating")
+        or it.get("rating_value")
+        or d.get("rating")
+        or (it.get("notes", {}).get("rating") if isinstance(it.get("notes"), dict) else None)
+    )
+
+    return (
+        to_int_or_none(instance_id),
+        to_int_or_none(release_id),
+        text_or_none(title),
+        join_names(artists, "name"),
+        join_names(labels, "name"),
+        to_int_or_none(year),
+        join_names(formats, "name"),
+        join_values(genres),
+        join_values(styles),
+        text_or_none(date_added),
+        to_int_or_none(rating),
+    )
+
+
+def parse_page(path: str) -> List[List[Any]]:
+    """
+    Load one JSON page and extract it as one list per column (COLLECTION_COLUMNS
+    order). Module-level so worker processes can pickle it.
+    """
+    rows = [item_to_row(it) for it in load_items(Path(path)) if isinstance(it, dict)]
+    if not rows:
+        return [[] for _ in COLLECTION_COLUMNS]
+    return [list(col) for col in zip(*rows)]
+
+
+# ============================================================
+# Polars reader (--reader polars)
+# ============================================================
+#
+# Same rules as item_to_row(), as expressions: `a or b` picks the first
+# *truthy* candidate (0, "" and [] fall through, like in Python), text is
+# stripped with "" → null, ints come from JSON ints or digit strings.
+# Pages whose shape polars can't map 1:1 fall back to parse_page().
+# Polars reads a key holding both ints and strings within one page as
+# strings, so there a JSON 0 counts as truthy "0"; Discogs API exports
+# keep one JSON type per key.
+
+
+class _PolarsUnsupported(Exception):
+    pass
+
+
+def _pl_field(df, schema: Dict[str, Any], name: str, struct: Optional[str] = None):
+    """(expr, dtype) for a top-level column or a field of a struct column; missing → null."""
+    if struct is None:
+        if name in schema:
+            return pl.col(name), schema[name]
+        return pl.lit(None), pl.Null
+    dtype = schema.get(struct)
+    if isinstance(dtype, pl.Struct):
+        for f in dtype.fields:
+            if f.name == name:
+                return pl.col(struct).struct.field(name), f.dtype
+    return pl.lit(None), pl.Null
+
+
+def _pl_truthy(e, dtype):
+    if dtype == pl.Null:
+        return pl.lit(False)
+    if dtype == pl.String:
+        return e.is_not_null() & (e != "")
+    if dtype.is_numeric() or dtype == pl.Boolean:
+        return e.is_not_null() & (e != 0)
+    if isinstance(dtype, pl.List):
+        return e.is_not_null() & (e.list.len() > 0)
+    return e.is_not_null()
+
+
+def _pl_text(e, dtype):
+    if dtype == pl.Null:
+        return pl.lit(None, dtype=pl.String)
+    if dtype == pl.String or dtype.is_integer():
+        s = e.cast(pl.String).str.strip_chars()
+        return pl.when(s != "").then(s)
+    raise _PolarsUnsupported(f"text from {dtype}")
+
+
+def _pl_int(e, dtype):
+    if dtype == pl.Null or dtype == pl.Boolean or dtype.is_float():
+        # to_int_or_none(): bools → None; floats stringify as "1990.0" → None
+        return pl.lit(None, dtype=pl.Int64)
+    if dtype.is_integer():
+        return e.cast(pl.Int64)
+    if dtype == pl.String:
+        s = e.str.strip_chars()
+        return pl.when(s.str.contains(r"^[0-9]+$")).then(s.cast(pl.Int64, strict=False))
+    raise _PolarsUnsupported(f"int from {dtype}")
+
+
+def _pl_first(candidates, convert, out_dtype):
+    """First truthy candidate, converted (Python's `a or b or c`, then convert)."""
+    expr = None
+    for e, dtype in candidates:
+        if dtype == pl.Null:
+            continue
+        cond, value = _pl_truthy(e, dtype), convert(e, dtype)
+        expr = pl.when(cond).then(value) if expr is None else expr.when(cond).then(value)
+    if expr is None:
+        return pl.lit(None, dtype=out_dtype)
+    return expr.otherwise(pl.lit(None, dtype=out_dtype))
+
+
+def _pl_join(e, dtype, key: Optional[str] = None):
+    """join_names() / join_values(): ", "-join non-empty stripped values of a list column."""
+    if not isinstance(dtype, pl.List):
+        if dtype == pl.Null:
+            return pl.lit(None, dtype=pl.String)
+        raise _PolarsUnsupported(f"join over {dtype}")
+    inner = dtype.inner
+    if key is not None:
+        if not isinstance(inner, pl.Struct) or key not in {f.name for f in inner.fields}:
+            return pl.lit(None, dtype=pl.String)
+        inner = next(f.dtype for f in inner.fields if f.name == key)
+        item = pl.element().struct.field(key)
+    else:
+        item = pl.element()
+    if not (inner == pl.String or inner.is_integer() or inner == pl.Null):
+        raise _PolarsUnsupported(f"join of {inner}")
+    v = item.cast(pl.String).str.strip_chars()
+    joined = e.list.eval(v.filter(v != "")).list.join(", ")
+    return pl.when(joined != "").then(joined)
+
+
+def parse_page_polars(path: str) -> List[List[Any]]:
+    """parse_page() via polars: same column lists, same values."""
+    p = Path(path)
+    with p.open("rb") as f:
+        head = f.read(64).lstrip()
+    try:
+        df = pl.read_json(p)
+        if head.startswith(b"{"):
+            # {"items": [...]} page; a dict without an items list has no rows
+            if not isinstance(df.schema.get("items"), pl.List):
+                return [[] for _ in COLLECTION_COLUMNS]
+            df = df.select(pl.col("items").explode()).filter(pl.col("items").is_not_null())
+            if df.schema["items"] == pl.Null:  # "items": []
+                return [[] for _ in COLLECTION_COLUMNS]
+            if not isinstance(df.schema["items"], pl.Struct):
+                raise _PolarsUnsupported("non-object items")
+            df = df.unnest("items")
+        if df.height == 0:
+            return [[] for _ in COLLECTION_COLUMNS]
+
+        schema = dict(df.schema)
+
+        def it(name):
+            return _pl_field(df, schema, name)
+
+        def bi(name):
+            return _pl_field(df, schema, name, "basic_information")
+
+        notes_rating = _pl_field(df, schema, "rating", "notes")
+
+        out = df.select(
+            _pl_first([it("id"), it("instance_id"), bi("instance_id")], _pl_int, pl.Int64).alias("instance_id"),
+            _pl_first([bi("id"), it("release_id")], _pl_int, pl.Int64).alias("release_id"),
+            _pl_text(*bi("title")).alias("title"),
+            _pl_join(*bi("artists"), key="name").alias("artists"),
+            _pl_join(*bi("labels"), key="name").alias("labels"),
+            _pl_int(*bi("year")).alias("year"),
+            _pl_join(*bi("formats"), key="name").alias("formats"),
+            _pl_join(*bi("genres")).alias("genres"),
+            _pl_join(*bi("styles")).alias("styles"),
+            _pl_first([it("date_added"), bi("date_added")], _pl_text, pl.String).alias("date_added"),
+            _pl_first(
+                [it("rating"), it("rating_value"), bi("rating"), notes_rating], _pl_int, pl.Int64
+            ).alias("rating"),
+        )
+    except (_PolarsUnsupported, pl.exceptions.PolarsError) as e:
+        print(f"⚠️  polars reader: {p.name}: {e}; using the Python parser for this page")
+        return parse_page(path)
+
+    return [out.get_column(c).to_list() for c in COLLECTION_COLUMNS]
 
 
 def main() -> int:
@@ -144,109 +383,69 @@ def main() -> int:
         return 2
 
     out_dir.mkdir(parents=True, exist_ok=True)
-    engine = args.engine or parquet_engine_preferred()
+    engine = args.engine or preferred_engine()
 
     files = sorted(glob.glob(str(src_dir / pattern)))
     print(f"📥 Found {len(files)} JSON files in {src_dir} (pattern: {pattern})")
     print(f"📦 Output: {out_dir}")
-    print(f"⚙️  chunk={args.chunk} engine={engine}")
-
-    rows: List[Dict[str, Any]] = []
-    part = 0
+    if args.reader == "polars" and not HAS_POLARS:
+        print("ERROR: --reader polars requires polars (pip install polars)", file=sys.stderr)
+        return 2
 
-    def flush() -> None:
-        nonlocal rows, part
-        if not rows:
+    chunk = int(args.chunk)
+    # polars is multithreaded already (and doesn't mix well with fork): keep it in-process
+    workers = 1 if args.reader == "polars" else max(1, args.workers)
+    page_parser = parse_page_polars if args.reader == "polars" else parse_page
+    print(f"⚙️  chunk={chunk} engine={engine} reader={args.reader} workers={workers}")
+
+    # one part per chunk; values are already int/str/None, written straight to Arrow.
+    # Pages are parsed in parallel, but writing stays here so parts come out in order.
+    writer = PartWriter(
+        out_dir,
+        COLLECTION_COLUMNS,
+        COLLECTION_INT_COLUMNS,
+        engine=engine,
+        rows_per_file=chunk,
+        file_pattern="collection_part{part:03d}.parquet",
+        dictionary_columns=COLLECTION_DICTIONARY_COLUMNS,
+    )
+
+    # one list per column (COLLECTION_COLUMNS order), no dict per row
+    columns: List[List[Any]] = [[] for _ in COLLECTION_COLUMNS]
+
+    def pages():
+        """Column lists per page, in file order (parsed in worker processes if workers > 1)."""
+        if workers <= 1 or len(files) <= 1:
+            yield from map(page_parser, files)
             return
-
-        df = pd.DataFrame(
-            rows,
-            columns=[
-                "instance_id",
-                "release_id",
-                "title",
-                "artists",
-                "labels",
-                "year",
-                "formats",
-                "genres",
-                "styles",
-                "date_added",
-                "rating",
-            ],
-        )
-
-        # Enforce numeric where expected by Trino
-        df["instance_id"] = pd.to_numeric(df["instance_id"], errors="coerce").astype("Int64")
-        df["release_id"] = pd.to_numeric(df["release_id"], errors="coerce").astype("Int64")
-        df["year"] = pd.to_numeric(df["year"], errors="coerce").astype("Int64")
-        df["rating"] = pd.to_numeric(df["rating"], errors="coerce").astype("Int64")
-
-        out_file = out_dir / f"collection_part{part:03d}.parquet"
-        df.to_parquet(out_file, engine=engine, index=False)
-        print(f"🧱 written {out_file.name}  ({len(df):,} rows)")
-
-        rows.clear()
-        part += 1
-
-    for fp in files:
-        p = Path(fp)
-        items = load_items(p)
-
-        for it in items:
-            if not isinstance(it, dict):
-                continue
-
-            d = it.get("basic_information", {})
-            if not isinstance(d, dict):
-                d = {}
-
-            instance_id = it.get("id") or it.get("instance_id") or d.get("instance_id")
-            release_id = d.get("id") or it.get("release_id")
-
-            title = d.get("title")
-            year = d.get("year")
-            genres = d.get("genres")
-            styles = d.get("styles")
-            labels = d.get("labels")
-            artists = d.get("artists")
-            formats = d.get("formats")
-            date_added = it.get("date_added") or d.get("date_added")
-
-            rating = (
-                it.get("rating")
-                or it.get("rating_value")
-                or d.get("rating")
-                or (it.get("notes", {}).get("rating") if isinstance(it.get("notes"), dict) else None)
-            )
-
-            rows.append(
-                {
-                    "instance_id": to_int_or_none(instance_id),
-                    "release_id": to_int_or_none(release_id),
-                    "title": text_or_none(title),
-                    "artists": join_names(artists, "name"),
-                    "labels": join_names(labels, "name"),
-                    "year": to_int_or_none(year),
-                    "formats": join_names(formats, "name"),
-                    "genres": join_values(genres),
-                    "styles": join_values(styles),
-                    "date_added": text_or_none(date_added),
-                    "rating": to_int_or_none(rating),
-                }
-            )
-
-            if len(rows) >= int(args.chunk):
-                flush()
-                if args.max_parts is not None and part >= args.max_parts:
-                    print(f"🧪 max-parts reached ({args.max_parts}), stopping early.")
-                    break
-
-        if args.max_parts is not None and part >= args.max_parts:
+        ex = ProcessPoolExecutor(max_workers=workers)
+        try:
+            yield from ex.map(parse_page, files, chunksize=4)
+        finally:
+            # early stop (--max-parts): drop pages not started yet
+            ex.shutdown(wait=True, cancel_futures=True)
+
+    pause_gc()
+    for page_columns in pages():
+        for col, values in zip(columns, page_columns):
+            col.extend(values)
+
+        while len(columns[0]) >= chunk:
+            writer.write([col[:chunk] for col in columns])
+            for col in columns:
+                del col[:chunk]
+            if args.max_parts is not None and writer.part >= args.max_parts:
+                break
+
+        if args.max_parts is not None and writer.part >= args.max_parts:
+            print(f"🧪 max-parts reached ({args.max_parts}), stopping early.")
+            for col in columns:
+                col.clear()
             break
 
-    flush()
-    print(f"✅ Done. Parts written: {part}  Output: {out_dir}")
+    writer.write(columns)
+    writer.close()
+    print(f"✅ Done. Parts written: {writer.part}  Output: {out_dir}")
     return 0
 
 
@@ -9,51 +9,127 @@ Fix reale:
   prima di processare la label top-level.
 
 Soluzione:
-- iterparse con ("start","end") + label_depth
-- processiamo SOLO i <label> top-level (label_depth == 1)
+- processiamo SOLO i <label> top-level (iter_top_labels)
+  - lxml: eventi "end" soltanto, top-level = figlia diretta della root
+  - stdlib: iterparse con ("start","end") + label_depth (label_depth == 1)
 - clear() SOLO del top-level dopo averlo scritto (così liberi tutta la subtree)
 """
 
 from __future__ import annotations
 
 import argparse
-import gzip
 import os
 import sys
-import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Optional, List, Dict, Any
-
-import pandas as pd
-
-
-def text_or_none(x) -> Optional[str]:
-    if x is None:
+from typing import Optional
+
+try:
+    from lxml import etree as ET
+    HAS_LXML = True
+except ImportError:  # fallback stdlib (più lento, niente tag=)
+    import xml.etree.ElementTree as ET
+    HAS_LXML = False
+
+from _pipeline_io import (
+    LABELS_COLUMNS,
+    LABELS_DICTIONARY_COLUMNS,
+    LABELS_INT_COLUMNS,
+    PartWriter,
+    open_dump,
+    pause_gc,
+    preferred_engine,
+)
+
+
+def to_int_or_none(x: Optional[str]) -> Optional[int]:
+    if not x:
+        return None
+    if x.isdecimal():
+        return int(x)
+    try:
+        return int(x)
+    except ValueError:
         return None
-    s = str(x).strip()
-    return s or None
-
 
-def join_csv(values: List[str]) -> Optional[str]:
-    return ", ".join(values) if values else None
 
+def compile_values(path: str, attr: Optional[str] = None):
+    """
+    Query compilata una volta che ritorna direttamente i valori (testo del
+    nodo, oppure l'attributo attr), non gli elementi.
+    - lxml: XPath ".../text()" o ".../@attr"; smart_strings=False così sono
+      str semplici (niente riferimento all'elemento padre)
+    - stdlib: findall() + .text / .get(attr), stessa firma
+    In entrambi i casi i nodi senza testo/attributo non compaiono: la lista
+    contiene solo str, quindi il chiamante può fare map(str.strip, ...).
+    """
+    if HAS_LXML:
+        return ET.XPath(f"{path}/@{attr}" if attr else f"{path}/text()", smart_strings=False)
+    if attr:
+        return lambda elem: [v for v in (e.get(attr) for e in elem.findall(path)) if v is not None]
+    return lambda elem: [e.text for e in elem.findall(path) if e.text is not None]
+
+
+URLS_XP = compile_values("urls/url")
+SUBLABEL_IDS_XP = compile_values("sublabels/label", "id")
+SUBLABEL_NAMES_XP = compile_values("sublabels/label")
+
+# figli diretti di <label> letti come testo semplice
+SCALAR_TAGS = frozenset({"id", "name", "profile", "contactinfo", "data_quality"})
+
+
+def iter_top_labels(f):
+    """
+    Yield solo le <label> top-level (le entity), già complete di sublabel.
+    Il chiamante le consuma prima di chiedere la prossima; poi qui si clear-a
+    tutta la subtree (e con lxml anche i fratelli precedenti sotto la root).
+
+    - lxml: solo eventi "end" filtrati in C (tag=); top-level = figlia diretta
+      della root, le sublabel (figlie di <sublabels>) si saltano senza clear.
+      recover=True: un frammento malformato non ferma tutto il dump.
+    - stdlib: ("start","end") + label_depth; dopo ogni top-level si clear-a
+      anche la root, così non accumula le label già processate.
+    """
+    if HAS_LXML:
+        for _, elem in ET.iterparse(f, events=("end",), tag="label", huge_tree=True, recover=True):
+            parent = elem.getparent()
+            if parent is not None and parent.getparent() is not None:
+                continue  # sublabel: NON processare e soprattutto NON clearare
+            yield elem
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        return
 
-def parquet_engine_preferred() -> str:
-    try:
-        import pyarrow  # noqa: F401
-        return "pyarrow"
-    except Exception:
-        return "fastparquet"
+    label_depth = 0
+    root = None
+    for event, elem in ET.iterparse(f, events=("start", "end")):
+        if root is None:
+            root = elem  # primo "start": <labels>
+        if elem.tag != "label":
+            continue
+        if event == "start":
+            label_depth += 1
+            continue
+        label_depth -= 1
+        if label_depth != 0:
+            continue  # sublabel
+        yield elem
+        elem.clear()
+        # clear() svuota la label ma la root la tiene ancora come figlia:
+        # senza questo la lista di figli cresce per tutto il dump
+        root.clear()
 
 
 def parse_args() -> argparse.Namespace:
     p = argparse.ArgumentParser(description="Parse Discogs labels dump to Parquet (labels_v10).")
     p.add_argument("--src", required=False, help="Path to labels XML dump (*.xml.gz).")
     p.add_argument("--out", required=False, help="Output dir. Default: $DISCOGS_DATA_LAKE/labels_v10")
-    p.add_argument("--batch", type=int, default=50_000, help="Rows per part (default: 50000).")
+    p.add_argument("--batch", type=int, default=50_000, help="Rows per batch / row group (default: 50000).")
+    p.add_argument("--rows-per-file", type=int, default=1_000_000,
+                   help="Roll to a new Parquet file after N rows (default: 1000000).")
     p.add_argument("--engine", choices=["pyarrow", "fastparquet"], default=None, help="Parquet engine override.")
     p.add_argument("--clean", action="store_true", help="Delete existing *.parquet in output dir before writing.")
-    p.add_argument("--max-parts", type=int, default=None, help="Stop after writing N parts (debug).")
+    p.add_argument("--max-parts", type=int, default=None, help="Stop after writing N batches (debug).")
     return p.parse_args()
 
 
@@ -94,148 +170,128 @@ def main() -> int:
         if n:
             print(f"🧹 Cleaned {n} parquet files in {out_dir}")
 
-    engine = args.engine or parquet_engine_preferred()
+    engine = args.engine or preferred_engine()
     batch = int(args.batch)
 
     print(f"📥 Source: {src}")
     print(f"📦 Output: {out_dir}")
-    print(f"⚙️  batch={batch} engine={engine} clean={bool(args.clean)} max_parts={args.max_parts}")
+    print(f"⚙️  batch={batch} rows_per_file={args.rows_per_file} engine={engine} clean={bool(args.clean)} max_parts={args.max_parts}")
 
-    rows: List[Dict[str, Any]] = []
-    part = 0
     written_total = 0
+    batches = 0
     skipped_no_id = 0
     skipped_non_entity = 0
 
-    def flush() -> None:
-        nonlocal rows, part, written_total
-        if not rows:
-            return
-
-        df = pd.DataFrame(
-            rows,
-            columns=[
-                "label_id",
-                "name",
-                "profile",
-                "contact_info",
-                "data_quality",
-                "parent_label_id",
-                "parent_label_name",
-                "urls_csv",
-                "sublabel_ids_csv",
-                "sublabel_names_csv",
-            ],
-        )
-
-        df["label_id"] = pd.to_numeric(df["label_id"], errors="coerce").astype("Int64")
-        df["parent_label_id"] = pd.to_numeric(df["parent_label_id"], errors="coerce").astype("Int64")
-
-        df = df[df["label_id"].notna()]
-
-        # forza testo come string (evita VARBINARY)
-        for c in [
-            "name",
-            "profile",
-            "contact_info",
-            "data_quality",
-            "parent_label_name",
-            "urls_csv",
-            "sublabel_ids_csv",
-            "sublabel_names_csv",
-        ]:
-            df[c] = df[c].astype("string")
-
-        out_file = out_dir / f"part-{part:05d}.parquet"
-        df.to_parquet(out_file, engine=engine, index=False)
-
-        written_total += len(df)
-        print(f"💾 written {out_file.name} ({len(df):,} rows)")
-
-        rows.clear()
-        part += 1
-
-    label_depth = 0
-
-    with gzip.open(src, "rb") as f:
-        for event, elem in ET.iterparse(f, events=("start", "end")):
-            if elem.tag != "label":
-                continue
+    # un ParquetWriter aperto per file: ogni batch è un row group, nuovo file
+    # ogni --rows-per-file righe (invece di un file per batch)
+    writer = PartWriter(
+        out_dir,
+        LABELS_COLUMNS,
+        LABELS_INT_COLUMNS,
+        engine=engine,
+        rows_per_file=args.rows_per_file,
+        dictionary_columns=LABELS_DICTIONARY_COLUMNS,
+    )
+
+    # una lista per colonna (ordine LABELS_COLUMNS), niente dict per riga;
+    # gli ID sono già int, quindi flush non deve convertire nulla
+    columns = writer.new_buffers()
+    label_ids = columns[0]
+    # append già legati (un lookup di attributo in meno per campo per riga)
+    (
+        add_label_id,
+        add_name,
+        add_profile,
+        add_contact_info,
+        add_data_quality,
+        add_parent_label_id,
+        add_parent_label_name,
+        add_urls_csv,
+        add_sublabel_ids_csv,
+        add_sublabel_names_csv,
+    ) = [col.append for col in columns]
 
-            if event == "start":
-                label_depth += 1
-                continue
-
-            # event == "end" for a <label>
-            # se non è top-level, NON processare e soprattutto NON clearare
-            if label_depth != 1:
-                label_depth -= 1
-                continue
+    def flush() -> None:
+        nonlocal written_total, batches
+        n = writer.write(columns)
+        if n:
+            written_total += n
+            batches += 1
 
-            # qui siamo al top-level label entity
-            try:
-                if elem.find("name") is None:
+    pause_gc()
+    try:
+        with open_dump(src) as f:
+            for elem in iter_top_labels(f):
+                # un solo giro sui figli invece di un findtext() per campo
+                # (vince il primo, come findtext)
+                fields = {}
+                for child in elem:
+                    tag = child.tag
+                    if tag in SCALAR_TAGS and tag not in fields:
+                        fields[tag] = child.text
+
+                if "name" not in fields:
                     skipped_non_entity += 1
                     continue
 
-                lid_raw = text_or_none(elem.get("id")) or text_or_none(elem.findtext("id"))
-                if not lid_raw or not lid_raw.isdigit():
+                # helper inline (milioni di chiamate): il parser dà solo str o None,
+                # quindi basta strip(); "" → None
+                lid_raw = elem.get("id")
+                lid_raw = lid_raw.strip() if lid_raw else None
+                if not lid_raw:
+                    lid_raw = fields.get("id")
+                    lid_raw = lid_raw.strip() if lid_raw else None
+                if not lid_raw or not lid_raw.isdecimal():
                     skipped_no_id += 1
                     continue
 
-                name = text_or_none(elem.findtext("name"))
-                profile = text_or_none(elem.findtext("profile"))
-                contact = text_or_none(elem.findtext("contactinfo"))
-                dq = text_or_none(elem.findtext("data_quality"))
+                name = fields["name"]
+                name = (name.strip() or None) if name else None
+                profile = fields.get("profile")
+                profile = (profile.strip() or None) if profile else None
+                contact = fields.get("contactinfo")
+                contact = (contact.strip() or None) if contact else None
+                # pochi valori distinti ("Correct", "Needs Vote", ...): una sola str condivisa
+                dq = fields.get("data_quality")
+                dq = (sys.intern(dq.strip()) or None) if dq else None
 
                 # ✅ parentLabel (camelCase)
                 parent = elem.find("parentLabel")
-                parent_id = text_or_none(parent.get("id")) if parent is not None else None
-                parent_name = text_or_none(parent.text) if parent is not None else None
-
-                urls_list: List[str] = []
-                for u in elem.findall("urls/url"):
-                    utxt = text_or_none(u.text)
-                    if utxt:
-                        urls_list.append(utxt)
-
-                s_ids: List[str] = []
-                s_names: List[str] = []
-                for s in elem.findall("sublabels/label"):
-                    sid = text_or_none(s.get("id"))
-                    sname = text_or_none(s.text)
-                    if sid:
-                        s_ids.append(sid)
-                    if sname:
-                        s_names.append(sname)
-
-                rows.append(
-                    {
-                        "label_id": lid_raw,
-                        "name": name,
-                        "profile": profile,
-                        "contact_info": contact,
-                        "data_quality": dq,
-                        "parent_label_id": parent_id,
-                        "parent_label_name": parent_name,
-                        "urls_csv": join_csv(urls_list),
-                        "sublabel_ids_csv": join_csv(s_ids),
-                        "sublabel_names_csv": join_csv(s_names),
-                    }
-                )
-
-                if len(rows) >= batch:
+                if parent is not None:
+                    parent_id = parent.get("id")
+                    parent_name = parent.text
+                    # stessa famiglia di sublabel → stesso nome: una sola str condivisa
+                    parent_name = (sys.intern(parent_name.strip()) or None) if parent_name else None
+                else:
+                    parent_id = parent_name = None
+
+                # liste di sole str: strip, salta i vuoti, "" → None
+                urls_csv = ", ".join(filter(None, map(str.strip, URLS_XP(elem)))) or None
+                sublabel_ids_csv = ", ".join(filter(None, map(str.strip, SUBLABEL_IDS_XP(elem)))) or None
+                sublabel_names_csv = ", ".join(filter(None, map(str.strip, SUBLABEL_NAMES_XP(elem)))) or None
+
+                add_label_id(int(lid_raw))
+                add_name(name)
+                add_profile(profile)
+                add_contact_info(contact)
+                add_data_quality(dq)
+                add_parent_label_id(to_int_or_none(parent_id))
+                add_parent_label_name(parent_name)
+                add_urls_csv(urls_csv)
+                add_sublabel_ids_csv(sublabel_ids_csv)
+                add_sublabel_names_csv(sublabel_names_csv)
+
+                if len(label_ids) >= batch:
                     flush()
-                    if args.max_parts is not None and part >= args.max_parts:
+                    if args.max_parts is not None and batches >= args.max_parts:
+                        print(f"🧪 max-parts reached ({args.max_parts}), stopping early.")
                         break
 
-            finally:
-                # ora sì: finita la top-level, cleariamo tutta la subtree
-                elem.clear()
-                label_depth -= 1
+        flush()
+    finally:
+        writer.close()
 
-    flush()
-    print(f"✅ Done. Parts written: {part}  Output: {out_dir}")
+    print(f"✅ Done. Parts written: {writer.part}  Output: {out_dir}")
     print(f"📊 written_total={written_total:,}")
     print(f"ℹ️ Skipped labels without numeric id: {skipped_no_id}")
     print(f"ℹ️ Skipped non-entity labels: {skipped_non_entity}")
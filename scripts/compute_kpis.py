@@ -2,153 +2,170 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import csv
+import functools
+import io
 import os
 import re
 import subprocess
 import sys
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 
+try:
+    import trino  # optional: talk HTTP to the coordinator instead of docker exec + CLI
+    HAS_TRINO_CLIENT = True
+except ImportError:
+    trino = None
+    HAS_TRINO_CLIENT = False
+
+try:
+    import pyarrow as pa  # optional: write KPI events as Parquet files instead of INSERT
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    pa = pq = None
+    HAS_PYARROW = False
+
 RUN_ID_RE = re.compile(r"^[0-9]{4}-[0-9]{2}__[0-9]{8}_[0-9]{6}$")
+# Target of the lake's "active" symlink
+ACTIVE_TARGET_RE = re.compile(r"^_runs/([0-9]{4}-[0-9]{2}__[0-9]{8}_[0-9]{6})$")
 
 # Trino objects
 REGISTRY_LATEST_VIEW = "hive.discogs_history.run_registry_latest"
 KPI_EVENTS_TABLE = "hive.discogs_history.kpi_snapshot_events"
+KPI_CACHE_TABLE = "hive.discogs_history.kpi_base_cache"
+KPI_LATEST_VIEW = "hive.discogs_history.kpi_snapshot_latest"
+KPI_MATERIALIZED_TABLE = "hive.discogs_history.kpi_snapshot_materialized"
 
 # Storage locations (must be dirs inside the container)
 KPI_EVENTS_LOCATION = "file:/data/hive-data/_meta/discogs_history/kpi/kpi_snapshot_events"
 KPI_EVENTS_DIR_CONTAINER = "/data/hive-data/_meta/discogs_history/kpi/kpi_snapshot_events"
+KPI_CACHE_LOCATION = "file:/data/hive-data/_meta/discogs_history/kpi/kpi_base_cache"
+KPI_CACHE_DIR_CONTAINER = "/data/hive-data/_meta/discogs_history/kpi/kpi_base_cache"
+KPI_MATERIALIZED_LOCATION = "file:/data/hive-data/_meta/discogs_history/kpi/kpi_snapshot_materialized"
+KPI_MATERIALIZED_DIR_CONTAINER = "/data/hive-data/_meta/discogs_history/kpi/kpi_snapshot_materialized"
+
+# Same events dir seen from the host (relative to DISCOGS_DATA_LAKE = /data/hive-data)
+KPI_EVENTS_DIR_HOST = "_meta/discogs_history/kpi/kpi_snapshot_events"
+KPI_MATERIALIZED_DIR_HOST = "_meta/discogs_history/kpi/kpi_snapshot_materialized"
+# The whole snapshot is this one file: os.replace() swaps it atomically
+KPI_MATERIALIZED_FILE = "kpi_snapshot.parquet"
+
+# Host-side marker written after ensure_kpi_objects() succeeded; bump the version
+# whenever the DDL in ensure_kpi_objects() changes so existing setups re-run it.
+KPI_BOOTSTRAP_VERSION = 1
+KPI_BOOTSTRAP_STAMP = f"_meta/discogs_history/kpi/kpi_bootstrap.v{KPI_BOOTSTRAP_VERSION}.done"
+
+# Columns of kpi_snapshot_latest copied into the materialized table (what the export reads)
+KPI_LATEST_COLUMNS = "event_ts_utc, run_id, schema_name, kpi_name, kpi_value, status, details"
 
 # ------------------------------------------------------------
-# KPI definitions (kpi_name -> (sql_template, expected_type))
-# sql_template will be formatted with: {schema}
+# Single-aggregate KPIs, grouped by source table when batched
+# (kpi_name -> (table, aggregate_expr, exact)); every KPI on the same table
+# comes from one scan.
+# exact=False: count(DISTINCT x) becomes approx_distinct(x, 0.005) unless
+# --exact. Release counts stay exact: they feed the derived bp ratios.
 # ------------------------------------------------------------
-KPI_DEFS = {
+KPI_AGGS = {
     # -------- v1 core --------
-    "n_releases_distinct": (
-        "SELECT CAST(count(DISTINCT release_id) AS BIGINT) FROM hive.{schema}.releases_ref_v6",
-        "BIGINT",
-    ),
-    "rows_releases_ref_v6": (
-        "SELECT CAST(count(*) AS BIGINT) FROM hive.{schema}.releases_ref_v6",
-        "BIGINT",
-    ),
-    "n_artists_distinct": (
-        "SELECT CAST(count(DISTINCT artist_id) AS BIGINT) FROM hive.{schema}.artists_v1_typed",
-        "BIGINT",
-    ),
-    "rows_artists_v1_typed": (
-        "SELECT CAST(count(*) AS BIGINT) FROM hive.{schema}.artists_v1_typed",
-        "BIGINT",
-    ),
-    "n_labels_distinct": (
-        "SELECT CAST(count(DISTINCT label_id) AS BIGINT) FROM hive.{schema}.labels_ref_v10",
-        "BIGINT",
-    ),
-    "rows_labels_ref_v10": (
-        "SELECT CAST(count(*) AS BIGINT) FROM hive.{schema}.labels_ref_v10",
-        "BIGINT",
-    ),
-    "n_masters_distinct": (
-        "SELECT CAST(count(DISTINCT master_id) AS BIGINT) FROM hive.{schema}.masters_v1_typed",
-        "BIGINT",
-    ),
-    "rows_masters_v1_typed": (
-        "SELECT CAST(count(*) AS BIGINT) FROM hive.{schema}.masters_v1_typed",
-        "BIGINT",
-    ),
+    "n_releases_distinct": ("releases_ref_v6", "count(DISTINCT release_id)", True),
+    "rows_releases_ref_v6": ("releases_ref_v6", "count(*)", True),
+    "n_artists_distinct": ("artists_v1_typed", "count(DISTINCT artist_id)", False),
+    "rows_artists_v1_typed": ("artists_v1_typed", "count(*)", True),
+    "n_labels_distinct": ("labels_ref_v10", "count(DISTINCT label_id)", False),
+    "rows_labels_ref_v10": ("labels_ref_v10", "count(*)", True),
+    "n_masters_distinct": ("masters_v1_typed", "count(DISTINCT master_id)", False),
+    "rows_masters_v1_typed": ("masters_v1_typed", "count(*)", True),
 
     # Optional warehouse v1 (kept)
-    "rows_release_artists_v1": (
-        "SELECT CAST(count(*) AS BIGINT) FROM hive.{schema}.release_artists_v1",
-        "BIGINT",
-    ),
-    "rows_release_label_xref_v1": (
-        "SELECT CAST(count(*) AS BIGINT) FROM hive.{schema}.release_label_xref_v1",
-        "BIGINT",
-    ),
+    "rows_release_artists_v1": ("release_artists_v1", "count(*)", True),
+    "rows_release_label_xref_v1": ("release_label_xref_v1", "count(*)", True),
 
     # -------- v2 base (derived tables) --------
 
     # release_artists_v1
-    "n_release_artist_links": (
-        "SELECT CAST(count(*) AS BIGINT) FROM hive.{schema}.release_artists_v1",
-        "BIGINT",
-    ),
-    "n_releases_with_artist_link": (
-        "SELECT CAST(count(DISTINCT release_id) AS BIGINT) FROM hive.{schema}.release_artists_v1",
-        "BIGINT",
-    ),
+    "n_release_artist_links": ("release_artists_v1", "count(*)", True),
+    "n_releases_with_artist_link": ("release_artists_v1", "count(DISTINCT release_id)", True),
 
     # release_label_xref_v1
-    "n_release_label_links": (
-        "SELECT CAST(count(*) AS BIGINT) FROM hive.{schema}.release_label_xref_v1",
-        "BIGINT",
-    ),
-    "n_releases_with_label_link": (
-        "SELECT CAST(count(DISTINCT release_id) AS BIGINT) FROM hive.{schema}.release_label_xref_v1",
-        "BIGINT",
-    ),
-    "n_label_norm_distinct": (
-        "SELECT CAST(count(DISTINCT label_norm) AS BIGINT) FROM hive.{schema}.release_label_xref_v1",
-        "BIGINT",
-    ),
+    "n_release_label_links": ("release_label_xref_v1", "count(*)", True),
+    "n_releases_with_label_link": ("release_label_xref_v1", "count(DISTINCT release_id)", True),
+    "n_label_norm_distinct": ("release_label_xref_v1", "count(DISTINCT label_norm)", False),
 
     # release_style_xref_v1
-    "n_release_style_links": (
-        "SELECT CAST(count(*) AS BIGINT) FROM hive.{schema}.release_style_xref_v1",
-        "BIGINT",
-    ),
-    "n_releases_with_style": (
-        "SELECT CAST(count(DISTINCT release_id) AS BIGINT) FROM hive.{schema}.release_style_xref_v1",
-        "BIGINT",
-    ),
-    "n_style_norm_distinct": (
-        "SELECT CAST(count(DISTINCT style_norm) AS BIGINT) FROM hive.{schema}.release_style_xref_v1",
-        "BIGINT",
-    ),
+    "n_release_style_links": ("release_style_xref_v1", "count(*)", True),
+    "n_releases_with_style": ("release_style_xref_v1", "count(DISTINCT release_id)", True),
+    "n_style_norm_distinct": ("release_style_xref_v1", "count(DISTINCT style_norm)", False),
 
     # release_genre_xref_v1
-    "n_release_genre_links": (
-        "SELECT CAST(count(*) AS BIGINT) FROM hive.{schema}.release_genre_xref_v1",
-        "BIGINT",
-    ),
-    "n_releases_with_genre": (
-        "SELECT CAST(count(DISTINCT release_id) AS BIGINT) FROM hive.{schema}.release_genre_xref_v1",
-        "BIGINT",
-    ),
-    "n_genre_norm_distinct": (
-        "SELECT CAST(count(DISTINCT genre_norm) AS BIGINT) FROM hive.{schema}.release_genre_xref_v1",
-        "BIGINT",
-    ),
+    "n_release_genre_links": ("release_genre_xref_v1", "count(*)", True),
+    "n_releases_with_genre": ("release_genre_xref_v1", "count(DISTINCT release_id)", True),
+    "n_genre_norm_distinct": ("release_genre_xref_v1", "count(DISTINCT genre_norm)", False),
 
     # label_release_counts_v1 (concentration)
-    "n_labels_in_counts_table": (
-        "SELECT CAST(count(*) AS BIGINT) FROM hive.{schema}.label_release_counts_v1",
-        "BIGINT",
-    ),
-    "label_counts_total_releases": (
-        "SELECT CAST(coalesce(sum(n_total_releases), 0) AS BIGINT) FROM hive.{schema}.label_release_counts_v1",
-        "BIGINT",
-    ),
-    "top_label_releases": (
-        "SELECT CAST(coalesce(max(n_total_releases), 0) AS BIGINT) FROM hive.{schema}.label_release_counts_v1",
-        "BIGINT",
-    ),
+    "n_labels_in_counts_table": ("label_release_counts_v1", "count(*)", True),
+    "label_counts_total_releases": ("label_release_counts_v1", "coalesce(sum(n_total_releases), 0)", True),
+    "top_label_releases": ("label_release_counts_v1", "coalesce(max(n_total_releases), 0)", True),
+    # max(x, 10) keeps a bounded top-10 heap per worker: no sort, same scan as above
     "top10_labels_releases": (
-        """
-        SELECT CAST(coalesce(sum(n_total_releases), 0) AS BIGINT)
-        FROM (
-          SELECT n_total_releases
-          FROM hive.{schema}.label_release_counts_v1
-          ORDER BY n_total_releases DESC
-          LIMIT 10
-        )
-        """.strip(),
-        "BIGINT",
+        "label_release_counts_v1",
+        "coalesce(reduce(max(n_total_releases, 10), BIGINT '0', (s, x) -> s + x, s -> s), 0)",
+        True,
     ),
 }
 
+# ------------------------------------------------------------
+# KPI definitions (kpi_name -> (sql_template, expected_type))
+# sql_template will be formatted with: {schema}
+# ------------------------------------------------------------
+KPI_DEFS = {
+    kpi_name: (f"SELECT CAST({expr} AS BIGINT) FROM hive.{{schema}}.{table}", "BIGINT")
+    for kpi_name, (table, expr, _) in KPI_AGGS.items()
+}
+
+# ------------------------------------------------------------
+# Derived KPI v2 (basis points): (kpi_name, numerator, denominator),
+# emitted only when the numerator was computed and the denominator is > 0
+# ------------------------------------------------------------
+DERIVED_KPIS = [
+    # Artists density/coverage
+    ("avg_artists_per_release_bp", "n_release_artist_links", "n_releases_distinct"),
+    ("pct_releases_with_artist_link_bp", "n_releases_with_artist_link", "n_releases_distinct"),
+    # Labels density/coverage
+    ("avg_labels_per_release_bp", "n_release_label_links", "n_releases_distinct"),
+    ("pct_releases_with_label_link_bp", "n_releases_with_label_link", "n_releases_distinct"),
+    # Styles density/coverage
+    ("avg_styles_per_release_bp", "n_release_style_links", "n_releases_distinct"),
+    ("pct_releases_with_style_bp", "n_releases_with_style", "n_releases_distinct"),
+    # Genres density/coverage
+    ("avg_genres_per_release_bp", "n_release_genre_links", "n_releases_distinct"),
+    ("pct_releases_with_genre_bp", "n_releases_with_genre", "n_releases_distinct"),
+    # Label concentration shares
+    ("top_label_share_bp", "top_label_releases", "label_counts_total_releases"),
+    ("top10_labels_share_bp", "top10_labels_releases", "label_counts_total_releases"),
+]
+
+COUNT_DISTINCT_RE = re.compile(r"count\(DISTINCT (\w+)\)")
+
+
+def approx_sql(sql: str) -> str:
+    # HyperLogLog instead of an exact distinct count (0.5% max standard error, one cheap pass)
+    return COUNT_DISTINCT_RE.sub(r"approx_distinct(\1, 0.005)", sql)
+
+
+def approx_kpis(exact: bool) -> frozenset[str]:
+    """KPI names computed with approx_distinct() (empty when --exact)."""
+    if exact:
+        return frozenset()
+    return frozenset(
+        kpi_name for kpi_name, (_, expr, is_exact) in KPI_AGGS.items()
+        if not is_exact and COUNT_DISTINCT_RE.search(expr)
+    )
+
 
 def eprint(msg: str) -> None:
     print(msg, file=sys.stderr)
@@ -166,15 +183,61 @@ def docker_exec(container: str, args: list[str], check: bool = True, capture: bo
     return run(["docker", "exec", "-i", container] + args, check=check, capture=capture)
 
 
-def trino_exec(container: str, catalog: str, sql: str, capture: bool = False) -> subprocess.CompletedProcess:
+# Set by main() when --trino-host is given: trino.dbapi.connect() kwargs.
+# One connection per thread, reused for every query of that thread.
+TRINO_HTTP: dict | None = None
+_tls = threading.local()
+
+
+def trino_conn():
+    conn = getattr(_tls, "conn", None)
+    if conn is None:
+        conn = _tls.conn = trino.dbapi.connect(**TRINO_HTTP)
+    return conn
+
+
+def tsv_value(v) -> str:
+    # Same rendering as the CLI's TSV output, so both paths share the parsers
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, datetime):
+        return v.isoformat(" ", "milliseconds")
+    return str(v).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def trino_exec(
+    container: str,
+    catalog: str,
+    sql: str,
+    capture: bool = False,
+) -> subprocess.CompletedProcess:
+    if TRINO_HTTP is not None:
+        cur = trino_conn().cursor()
+        cur.execute(sql.strip().rstrip(";"))
+        rows = cur.fetchall()  # also drives non-SELECT statements to completion
+        stdout = "\n".join("\t".join(map(tsv_value, r)) for r in rows) if capture else None
+        return subprocess.CompletedProcess(["trino", sql], 0, stdout=stdout)
+
+    args = ["trino"]
     # TSV when capture=True to make parsing deterministic
     if capture:
-        args = ["trino", "--output-format", "TSV", "--catalog", catalog, "--execute", sql]
-    else:
-        args = ["trino", "--catalog", catalog, "--execute", sql]
+        args += ["--output-format", "TSV"]
+    args += ["--catalog", catalog, "--execute", sql]
     return docker_exec(container, args, check=True, capture=capture)
 
 
+def tsv_rows(stdout: str | None):
+    # C tokenizer instead of splitlines()/split() per line; blank lines come back as []
+    return csv.reader(io.StringIO(stdout or ""), delimiter="\t", quoting=csv.QUOTE_NONE)
+
+
+def tsv_unescape(s: str) -> str:
+    # Inverse of the TSV escaping of backslash, TAB and newline
+    return re.sub(r"\\(.)", lambda m: {"t": "\t", "n": "\n"}.get(m.group(1), m.group(1)), s)
+
+
 def require_env(name: str) -> str:
     v = os.environ.get(name, "")
     if not v:
@@ -197,18 +260,22 @@ def schema_for_run_id(run_id: str) -> str:
 
 
 def read_active_run_id(lake: Path) -> str:
-    active = lake / "active"
-    if not active.is_symlink():
+    # readlink fails with OSError when "active" is missing or not a symlink: one syscall
+    try:
+        target = os.readlink(lake / "active")
+    except OSError:
         return ""
-    target = os.readlink(active)
-    m = re.match(r"^_runs/([0-9]{4}-[0-9]{2}__[0-9]{8}_[0-9]{6})$", target)
+    m = ACTIVE_TARGET_RE.match(target)
     return m.group(1) if m else ""
 
 
 def ensure_kpi_objects(container: str, catalog: str) -> None:
-    # Ensure directory exists for external_location (container-side)
-    docker_exec(container, ["sh", "-lc", f"mkdir -p {KPI_EVENTS_DIR_CONTAINER}"], check=True)
-    docker_exec(container, ["sh", "-lc", f"test -d {KPI_EVENTS_DIR_CONTAINER}"], check=True)
+    # Ensure directories exist for external_location (container-side)
+    dirs = f"{KPI_EVENTS_DIR_CONTAINER} {KPI_CACHE_DIR_CONTAINER} {KPI_MATERIALIZED_DIR_CONTAINER}"
+    # (also the container reachability check: mkdir -p only succeeds if the dirs exist after)
+    cp = docker_exec(container, ["sh", "-lc", f"mkdir -p {dirs} && echo READY"], check=False, capture=True)
+    if cp.returncode != 0 or "READY" not in (cp.stdout or ""):
+        raise SystemExit(f"ERROR: container {container} not ready: {(cp.stderr or '').strip()}")
 
     # Create table (idempotent). Schema discogs_history should already exist.
     trino_exec(
@@ -233,6 +300,120 @@ def ensure_kpi_objects(container: str, catalog: str) -> None:
         capture=False,
     )
 
+    # Base KPI roll-up: one ok value per (run_id, kpi_name). Run schemas are
+    # immutable, so a cached value never needs recomputing.
+    trino_exec(
+        container,
+        catalog,
+        f"""
+        CREATE TABLE IF NOT EXISTS {KPI_CACHE_TABLE} (
+          run_id         VARCHAR,
+          schema_name    VARCHAR,
+          kpi_name       VARCHAR,
+          kpi_value      BIGINT
+        )
+        WITH (
+          external_location = '{KPI_CACHE_LOCATION}',
+          format = 'PARQUET'
+        );
+        """.strip(),
+        capture=False,
+    )
+
+    # Snapshot of kpi_snapshot_latest: one Parquet file swapped by refresh_kpi_materialized()
+    trino_exec(
+        container,
+        catalog,
+        f"""
+        CREATE TABLE IF NOT EXISTS {KPI_MATERIALIZED_TABLE} (
+          event_ts_utc   TIMESTAMP,
+          run_id         VARCHAR,
+          schema_name    VARCHAR,
+          kpi_name       VARCHAR,
+          kpi_value      BIGINT,
+          status         VARCHAR,
+          details        VARCHAR
+        )
+        WITH (
+          external_location = '{KPI_MATERIALIZED_LOCATION}',
+          format = 'PARQUET'
+        );
+        """.strip(),
+        capture=False,
+    )
+
+
+def refresh_kpi_materialized(container: str, catalog: str, snapshot_dir: Path) -> None:
+    """
+    Replace kpi_snapshot_materialized with the current kpi_snapshot_latest (small table).
+    The rows are written as one Parquet file in the table's external_location under a
+    hidden name and renamed over the previous snapshot, so readers see the old or the
+    new snapshot, never a mix or a partial file.
+    """
+    cp = trino_exec(container, catalog, f"SELECT {KPI_LATEST_COLUMNS} FROM {KPI_LATEST_VIEW}", capture=True)
+    rows = [parts for parts in tsv_rows(cp.stdout) if len(parts) == 7]
+    cols = list(zip(*rows)) or [()] * 7
+    table = pa.table(
+        {
+            "event_ts_utc": pa.array(
+                [datetime.fromisoformat(v) if v else None for v in cols[0]], pa.timestamp("ms")
+            ),
+            "run_id": pa.array(cols[1], pa.string()),
+            "schema_name": pa.array(cols[2], pa.string()),
+            "kpi_name": pa.array(cols[3], pa.string()),
+            "kpi_value": pa.array([int(v) if v else None for v in cols[4]], pa.int64()),
+            "status": pa.array(cols[5], pa.string()),
+            "details": pa.array([tsv_unescape(v) for v in cols[6]], pa.string()),
+        }
+    )
+    tmp = snapshot_dir / f".{KPI_MATERIALIZED_FILE}.tmp"
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, snapshot_dir / KPI_MATERIALIZED_FILE)
+    # Files left by INSERT-based refreshes of older versions would be read as extra rows
+    for f in snapshot_dir.iterdir():
+        if f.name != KPI_MATERIALIZED_FILE and not f.name.startswith((".", "_")):
+            f.unlink()
+
+
+def fetch_cached_kpis(container: str, catalog: str, run_id: str) -> dict[str, int]:
+    """Base KPI values already computed for run_id (kpi_name -> kpi_value)."""
+    sql = f"""
+    SELECT kpi_name, max(kpi_value)
+    FROM {KPI_CACHE_TABLE}
+    WHERE run_id = '{sql_escape(run_id)}'
+    GROUP BY kpi_name
+    """.strip()
+
+    cp = trino_exec(container, catalog, sql, capture=True)
+    cached: dict[str, int] = {}
+    for parts in tsv_rows(cp.stdout):
+        if len(parts) != 2 or not parts[1]:
+            continue
+        cached[parts[0]] = int(parts[1])
+    return cached
+
+
+def insert_kpi_cache(
+    container: str,
+    catalog: str,
+    run_id: str,
+    schema_name: str,
+    values: dict[str, int],
+) -> None:
+    if not values:
+        return
+    rows = ",\n      ".join(
+        f"('{sql_escape(run_id)}', '{sql_escape(schema_name)}', '{sql_escape(kpi_name)}', {kpi_value})"
+        for kpi_name, kpi_value in values.items()
+    )
+    sql = f"""
+    INSERT INTO {KPI_CACHE_TABLE} (run_id, schema_name, kpi_name, kpi_value)
+    VALUES
+      {rows};
+    """.strip()
+
+    trino_exec(container, catalog, sql, capture=False)
+
 
 def fetch_runs_to_process(
     container: str,
@@ -260,11 +441,7 @@ def fetch_runs_to_process(
 
     cp = trino_exec(container, catalog, sql, capture=True)
     rows = []
-    for line in (cp.stdout or "").splitlines():
-        line = line.strip()
-        if not line:
-            continue
-        parts = line.split("\t")
+    for parts in tsv_rows(cp.stdout):
         if len(parts) != 3:
             continue
         rid, schema, is_active_s = parts
@@ -272,9 +449,12 @@ def fetch_runs_to_process(
     return rows
 
 
-def insert_kpi_event(
-    container: str,
-    catalog: str,
+# Rows per INSERT ... VALUES statement (keeps the query text well under Trino's limits)
+KPI_INSERT_BATCH = 500
+
+
+def add_kpi_event(
+    pending: list[tuple],
     event_ts: str,
     run_id: str,
     schema_name: str,
@@ -284,34 +464,108 @@ def insert_kpi_event(
     details: str,
     schema_version: int,
 ) -> None:
-    sql = f"""
+    """Buffer one kpi_snapshot_events row; written by flush_kpi_events()."""
+    pending.append((event_ts, run_id, schema_name, kpi_name, kpi_value, status, details, schema_version))
+
+
+def kpi_event_values(event: tuple) -> str:
+    event_ts, run_id, schema_name, kpi_name, kpi_value, status, details, schema_version = event
+    return (
+        f"(TIMESTAMP '{sql_escape(event_ts)}', "
+        f"'{sql_escape(run_id)}', "
+        f"'{sql_escape(schema_name)}', "
+        f"'{sql_escape(kpi_name)}', "
+        f"{int(kpi_value)}, "
+        f"'{sql_escape(status)}', "
+        f"'{sql_escape(details)}', "
+        f"{int(schema_version)})"
+    )
+
+
+def write_kpi_events_parquet(events_dir: Path, run_id: str, pending: list[tuple]) -> Path:
+    """
+    Write one run's events as a Parquet file straight into the external_location
+    of kpi_snapshot_events (no Trino write). Written under a hidden name and renamed,
+    so Trino never lists a partial file.
+    """
+    cols = list(zip(*pending))
+    table = pa.table(
+        {
+            "event_ts_utc": pa.array(
+                [datetime.strptime(ts, "%Y-%m-%d %H:%M:%S") for ts in cols[0]], pa.timestamp("ms")
+            ),
+            "run_id": pa.array(cols[1], pa.string()),
+            "schema_name": pa.array(cols[2], pa.string()),
+            "kpi_name": pa.array(cols[3], pa.string()),
+            "kpi_value": pa.array(cols[4], pa.int64()),
+            "status": pa.array(cols[5], pa.string()),
+            "details": pa.array(cols[6], pa.string()),
+            "schema_version": pa.array(cols[7], pa.int64()),
+        }
+    )
+    stamp = cols[0][0].replace("-", "").replace(":", "").replace(" ", "_")
+    name = f"run={run_id}_ts={stamp}_{uuid.uuid4().hex[:8]}.parquet"
+    tmp = events_dir / f".{name}.tmp"
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, events_dir / name)
+    return events_dir / name
+
+
+def flush_kpi_events(
+    container: str,
+    catalog: str,
+    run_id: str,
+    pending: list[tuple],
+    events_dir: Path | None = None,
+) -> None:
+    """
+    Write buffered events: one Parquet file in events_dir when given, otherwise
+    one multi-row INSERT per KPI_INSERT_BATCH rows, in order.
+    """
+    if pending and events_dir is not None:
+        write_kpi_events_parquet(events_dir, run_id, pending)
+        pending.clear()
+        return
+    for i in range(0, len(pending), KPI_INSERT_BATCH):
+        rows = ",\n      ".join(map(kpi_event_values, pending[i:i + KPI_INSERT_BATCH]))
+        sql = f"""
     INSERT INTO {KPI_EVENTS_TABLE} (
       event_ts_utc, run_id, schema_name, kpi_name, kpi_value, status, details, schema_version
     )
-    VALUES (
-      TIMESTAMP '{sql_escape(event_ts)}',
-      '{sql_escape(run_id)}',
-      '{sql_escape(schema_name)}',
-      '{sql_escape(kpi_name)}',
-      {kpi_value},
-      '{sql_escape(status)}',
-      '{sql_escape(details)}',
-      {schema_version}
-    );
+    VALUES
+      {rows};
     """.strip()
 
-    trino_exec(container, catalog, sql, capture=False)
+        trino_exec(container, catalog, sql, capture=False)
+    pending.clear()
 
 
 def parse_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser(description="Compute KPI snapshots for Discogs history runs into Trino.")
     ap.add_argument("--trino-container", required=True)
     ap.add_argument("--trino-catalog", required=True)
+    ap.add_argument("--trino-host", default="",
+                    help="Query the coordinator over HTTP (needs the 'trino' Python client); "
+                         "the container is still used for storage dirs")
+    ap.add_argument("--trino-port", type=int, default=8080)
+    ap.add_argument("--trino-user", default="kpi")
     ap.add_argument("--schema-version", type=int, default=1)
     ap.add_argument("--only-run-id", default="", help="Process only this run_id (safe mode)")
     ap.add_argument("--include-active", action="store_true", help="Also compute KPIs for active (schema 'discogs')")
     ap.add_argument("--kpi", default="", help="Compute only one KPI (by name) from KPI_DEFS")
     ap.add_argument("--strict", action="store_true", help="Fail the whole run if any KPI query fails")
+    ap.add_argument("--parallel-runs", type=int, default=4,
+                    help="Runs computed concurrently (default: 4)")
+    ap.add_argument("--force-bootstrap", action="store_true",
+                    help="Re-run storage dir + table setup even if the bootstrap stamp exists")
+    ap.add_argument("--recompute", action="store_true",
+                    help="Ignore kpi_base_cache and recompute every base KPI")
+    ap.add_argument("--insert-events", action="store_true",
+                    help="Write KPI events with INSERT through Trino instead of Parquet files "
+                         "in the host-side events dir")
+    ap.add_argument("--exact", action="store_true",
+                    help="Exact count(DISTINCT ...) for every KPI (audit / monthly cache fill); "
+                         "by default non-EXACT KPIs use approx_distinct() and are not cached")
     return ap.parse_args()
 
 
@@ -326,6 +580,62 @@ def first_tsv_value(stdout: str) -> str:
     return ""
 
 
+@functools.cache
+def compile_kpi_sql(schema: str) -> dict[str, str]:
+    """KPI_DEFS templates formatted for one schema (kpi_name -> sql), built once per schema."""
+    return {kpi_name: sql_tpl.format(schema=schema) for kpi_name, (sql_tpl, _) in KPI_DEFS.items()}
+
+
+def batched_kpi_sql(
+    kpi_items: list[tuple[str, tuple[str, str]]],
+    schema_name: str,
+    approx: frozenset[str] = frozenset(),
+) -> str:
+    """
+    One statement for all of kpi_items, returning one row (column order = kpi_items):
+    one single-pass aggregate per KPI_AGGS source table; the one-row parts are
+    cross joined. KPIs in approx use approx_distinct() instead of count(DISTINCT ...).
+    """
+    by_table: dict[str, list[str]] = {}
+    for kpi_name, _ in kpi_items:
+        table, expr, _ = KPI_AGGS[kpi_name]  # KPI_DEFS is built from KPI_AGGS
+        if kpi_name in approx:
+            expr = approx_sql(expr)
+        by_table.setdefault(table, []).append(f"CAST({expr} AS BIGINT) AS {kpi_name}")
+    parts = [
+        f"(SELECT {', '.join(cols)} FROM hive.{schema_name}.{table})"
+        for table, cols in by_table.items()
+    ]
+
+    select = ", ".join(kpi_name for kpi_name, _ in kpi_items)
+    return f"SELECT {select}\nFROM " + "\nCROSS JOIN ".join(
+        f"{part} t{i}" for i, part in enumerate(parts)
+    )
+
+
+def query_kpis_batched(
+    container: str,
+    catalog: str,
+    kpi_items: list[tuple[str, tuple[str, str]]],
+    schema_name: str,
+    approx: frozenset[str] = frozenset(),
+) -> dict[str, int]:
+    """
+    Compute all base KPIs of one run with a single Trino statement (one scan per table),
+    returned as one TSV row (column order = kpi_items).
+    Raises if the statement fails or the row does not parse; caller falls back
+    to one query per KPI so failures stay attributed to the right KPI.
+    """
+    sql = batched_kpi_sql(kpi_items, schema_name, approx)
+    cp = trino_exec(container, catalog, sql, capture=True)
+
+    first = first_tsv_value(cp.stdout or "")
+    parts = first.split("\t") if first else []
+    if len(parts) != len(kpi_items):
+        raise RuntimeError(f"unexpected_result: {len(parts)} columns for {len(kpi_items)} KPIs")
+    return {kpi_name: int(v) for (kpi_name, _), v in zip(kpi_items, parts)}
+
+
 def safe_bp(numer: int, denom: int) -> int:
     # basis points: 10000 = 100.00%
     if denom <= 0:
@@ -333,7 +643,124 @@ def safe_bp(numer: int, denom: int) -> int:
     return (numer * 10000) // denom
 
 
+def process_run(
+    args: argparse.Namespace,
+    kpi_items: list[tuple[str, tuple[str, str]]],
+    rid: str,
+    schema_name: str,
+    is_active: bool,
+) -> tuple[list[str], list[str], dict[str, int], str]:
+    """
+    Compute base + derived KPIs of one run (safe to run concurrently for different runs).
+    Nothing is written and nothing is printed here: returns
+    (log_lines, pending_events, computed_exact_base_values, strict_abort_message).
+    """
+    log: list[str] = []
+    # One timestamp for every event of this run's snapshot (base + derived)
+    event_ts = utc_now_ts()
+    if not is_active:
+        expected_schema = schema_for_run_id(rid)
+        if schema_name != expected_schema:
+            log.append(f"[WARN] registry schema mismatch for {rid}: registry={schema_name} expected={expected_schema}")
+
+    log.append(f"== run {rid} (schema hive.{schema_name}) ==")
+
+    # Collect base KPI results for derived calculations, seeded from the roll-up:
+    # only KPIs not cached yet for this run are queried.
+    vals: dict[str, int] = {}
+    if not args.recompute:
+        cached = fetch_cached_kpis(args.trino_container, args.trino_catalog, rid)
+        for kpi_name, _ in kpi_items:
+            if kpi_name in cached:
+                vals[kpi_name] = cached[kpi_name]
+                log.append(f"[CACHED] {kpi_name}={cached[kpi_name]}")
+    todo = [(kpi_name, d) for kpi_name, d in kpi_items if kpi_name not in vals]
+    # Exact values computed now (what may go into the cache)
+    computed: dict[str, int] = {}
+    approx = approx_kpis(args.exact)
+    # Events of this run, written with one INSERT at the end of the run
+    pending: list[tuple] = []
+
+    # One statement for all base KPIs (one docker exec + CLI start instead of N).
+    # If it fails (e.g. a table missing in an old run), fall back to per-KPI queries.
+    batch_vals: dict[str, int] | None = None
+    if len(todo) > 1:
+        try:
+            batch_vals = query_kpis_batched(args.trino_container, args.trino_catalog, todo, schema_name, approx)
+        except Exception as ex:
+            log.append(f"[WARN] batched KPI query failed, falling back to per-KPI queries: {ex}")
+
+    for kpi_name, _ in todo:
+        try:
+            if batch_vals is not None:
+                val = batch_vals[kpi_name]
+            else:
+                sql = compile_kpi_sql(schema_name)[kpi_name]
+                if kpi_name in approx:
+                    sql = approx_sql(sql)
+                cp = trino_exec(args.trino_container, args.trino_catalog, sql, capture=True)
+                first = first_tsv_value(cp.stdout or "")
+                if not first:
+                    raise RuntimeError("empty_result")
+
+                val = int(first)
+            vals[kpi_name] = val
+            if kpi_name in approx:
+                details = "approx"
+            else:
+                computed[kpi_name] = val
+                details = ""
+
+            add_kpi_event(
+                pending,
+                event_ts,
+                rid,
+                schema_name,
+                kpi_name,
+                val,
+                "ok",
+                details,
+                args.schema_version,
+            )
+            log.append(f"[OK] {kpi_name}={val}")
+
+        except Exception as ex:
+            msg = str(ex)
+            add_kpi_event(
+                pending,
+                event_ts,
+                rid,
+                schema_name,
+                kpi_name,
+                0,
+                "failed_query",
+                msg[:500],
+                args.schema_version,
+            )
+            log.append(f"[FAIL] {kpi_name}: {msg}")
+
+            if args.strict:
+                # main() still writes the events so far (incl. this failure), then aborts
+                return log, pending, computed, f"ERROR: strict mode, aborting on KPI failure: {kpi_name} for run {rid}"
+
+    # ------------------------------------------------------------
+    # Derived KPI v2 (basis points) computed from base values
+    # Only if we computed the needed inputs.
+    # ------------------------------------------------------------
+    # NOTE: If user runs --kpi, we intentionally do NOT invent derived KPIs.
+    if not args.kpi:
+        for kpi_name, numer, denom in DERIVED_KPIS:
+            if numer in vals and vals.get(denom, 0) > 0:
+                v = safe_bp(vals[numer], vals[denom])
+                add_kpi_event(pending, event_ts, rid, schema_name,
+                              kpi_name, v, "ok", "", args.schema_version)
+                log.append(f"[OK] {kpi_name}={v}")
+
+    return log, pending, computed, ""
+
+
 def main() -> None:
+    global TRINO_HTTP
     args = parse_args()
 
     lake_s = require_env("DISCOGS_DATA_LAKE")
@@ -343,8 +770,26 @@ def main() -> None:
     if args.only_run_id and not RUN_ID_RE.match(args.only_run_id):
         raise SystemExit(f"ERROR: invalid run_id format: {args.only_run_id}")
 
-    docker_exec(args.trino_container, ["sh", "-lc", "true"], check=True)
-    ensure_kpi_objects(args.trino_container, args.trino_catalog)
+    if args.trino_host:
+        if not HAS_TRINO_CLIENT:
+            raise SystemExit("ERROR: --trino-host needs the 'trino' Python client (pip install trino)")
+        TRINO_HTTP = dict(host=args.trino_host, port=args.trino_port, user=args.trino_user, catalog=args.trino_catalog)
+
+    # Storage dirs + tables only once per DDL version (three docker exec / Trino calls saved per run)
+    stamp = lake / KPI_BOOTSTRAP_STAMP
+    if args.force_bootstrap or not stamp.exists():
+        ensure_kpi_objects(args.trino_container, args.trino_catalog)
+        stamp.parent.mkdir(parents=True, exist_ok=True)
+        stamp.touch()
+
+    # The events table is external: Parquet files dropped in its dir are read by Trino
+    # directly, so no INSERT (and no Trino write path) is needed when the dir is on this host.
+    events_dir = lake / KPI_EVENTS_DIR_HOST
+    if args.insert_events or not HAS_PYARROW or not events_dir.is_dir():
+        events_dir = None
+    snapshot_dir = lake / KPI_MATERIALIZED_DIR_HOST
+    if not HAS_PYARROW or not snapshot_dir.is_dir():
+        snapshot_dir = None
 
     runs = fetch_runs_to_process(
         args.trino_container,
@@ -364,6 +809,7 @@ def main() -> None:
             raise SystemExit(f"ERROR: unknown KPI name: {args.kpi}")
         kpi_items = [(args.kpi, KPI_DEFS[args.kpi])]
 
+    # The active/ symlink is the authority (one readlink), not the manifest's run_id
     active_run_id = read_active_run_id(lake)
 
     eprint("==============================================")
@@ -372,146 +818,42 @@ def main() -> None:
     eprint(f" lake   : {lake}")
     eprint(f" active : {active_run_id or '<unknown>'}")
     eprint(f" trino  : container={args.trino_container} catalog={args.trino_catalog}")
+    if args.trino_host:
+        eprint(f" http   : {args.trino_host}:{args.trino_port} user={args.trino_user}")
     eprint(f" schema_version : {args.schema_version}")
-    eprint(f" runs   : {len(runs)}")
+    eprint(f" events : {events_dir or 'INSERT via Trino'}")
+    eprint(f" runs   : {len(runs)} (parallel={args.parallel_runs})")
     if args.kpi:
         eprint(f" kpi    : {args.kpi}")
     eprint("==============================================")
 
-    for rid, schema_name, is_active in runs:
-        if not is_active:
-            expected_schema = schema_for_run_id(rid)
-            if schema_name != expected_schema:
-                eprint(f"[WARN] registry schema mismatch for {rid}: registry={schema_name} expected={expected_schema}")
-
-        eprint(f"== run {rid} (schema hive.{schema_name}) ==")
-
-        # Collect base KPI results for derived calculations
-        vals: dict[str, int] = {}
-
-        for kpi_name, (sql_tpl, _) in kpi_items:
-            sql = sql_tpl.format(schema=schema_name)
-            event_ts = utc_now_ts()
-
+    # Runs are independent schemas: compute them concurrently (bounded), but print,
+    # write events and fill the cache from this thread, in run order.
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.parallel_runs)) as ex:
+            results = ex.map(lambda r: process_run(args, kpi_items, *r), runs)
+            for (rid, schema_name, _), (log, pending, computed, abort) in zip(runs, results):
+                for line in log:
+                    eprint(line)
+
+                flush_kpi_events(args.trino_container, args.trino_catalog, rid, pending, events_dir)
+                if abort:
+                    ex.shutdown(wait=False, cancel_futures=True)
+                    raise SystemExit(abort)
+                # Only exact ok values are cached; failed KPIs are retried on the next invocation
+                insert_kpi_cache(args.trino_container, args.trino_catalog, rid, schema_name, computed)
+    finally:
+        # Readers (export_history_csv) use the snapshot instead of the view's window scan.
+        # Also after a --strict abort or an error: events already written must show up.
+        # A stale snapshot is not fatal, the export falls back to the view.
+        if snapshot_dir is None:
+            eprint("[WARN] kpi_snapshot_materialized not refreshed (no pyarrow or host dir)")
+        else:
             try:
-                cp = trino_exec(args.trino_container, args.trino_catalog, sql, capture=True)
-                first = first_tsv_value(cp.stdout or "")
-                if not first:
-                    raise RuntimeError("empty_result")
-
-                val = int(first)
-                vals[kpi_name] = val
-
-                insert_kpi_event(
-                    args.trino_container,
-                    args.trino_catalog,
-                    event_ts,
-                    rid,
-                    schema_name,
-                    kpi_name,
-                    val,
-                    "ok",
-                    "",
-                    args.schema_version,
-                )
-                eprint(f"[OK] {kpi_name}={val}")
-
-            except Exception as ex:
-                msg = str(ex)
-                insert_kpi_event(
-                    args.trino_container,
-                    args.trino_catalog,
-                    event_ts,
-                    rid,
-                    schema_name,
-                    kpi_name,
-                    0,
-                    "failed_query",
-                    msg[:500],
-                    args.schema_version,
-                )
-                eprint(f"[FAIL] {kpi_name}: {msg}")
-
-                if args.strict:
-                    raise SystemExit(f"ERROR: strict mode, aborting on KPI failure: {kpi_name} for run {rid}")
-
-        # ------------------------------------------------------------
-        # Derived KPI v2 (basis points) computed from base values
-        # Only if we computed the needed inputs.
-        # ------------------------------------------------------------
-        # NOTE: If user runs --kpi, we intentionally do NOT invent derived KPIs.
-        if not args.kpi:
-            event_ts = utc_now_ts()
-
-            n_releases = vals.get("n_releases_distinct", 0)
-
-            # Artists density/coverage
-            if "n_release_artist_links" in vals and n_releases > 0:
-                v = safe_bp(vals["n_release_artist_links"], n_releases)
-                insert_kpi_event(args.trino_container, args.trino_catalog, event_ts, rid, schema_name,
-                                 "avg_artists_per_release_bp", v, "ok", "", args.schema_version)
-                eprint(f"[OK] avg_artists_per_release_bp={v}")
-
-            if "n_releases_with_artist_link" in vals and n_releases > 0:
-                v = safe_bp(vals["n_releases_with_artist_link"], n_releases)
-                insert_kpi_event(args.trino_container, args.trino_catalog, event_ts, rid, schema_name,
-                                 "pct_releases_with_artist_link_bp", v, "ok", "", args.schema_version)
-                eprint(f"[OK] pct_releases_with_artist_link_bp={v}")
-
-            # Labels density/coverage
-            if "n_release_label_links" in vals and n_releases > 0:
-                v = safe_bp(vals["n_release_label_links"], n_releases)
-                insert_kpi_event(args.trino_container, args.trino_catalog, event_ts, rid, schema_name,
-                                 "avg_labels_per_release_bp", v, "ok", "", args.schema_version)
-                eprint(f"[OK] avg_labels_per_release_bp={v}")
-
-            if "n_releases_with_label_link" in vals and n_releases > 0:
-                v = safe_bp(vals["n_releases_with_label_link"], n_releases)
-                insert_kpi_event(args.trino_container, args.trino_catalog, event_ts, rid, schema_name,
-                                 "pct_releases_with_label_link_bp", v, "ok", "", args.schema_version)
-                eprint(f"[OK] pct_releases_with_label_link_bp={v}")
-
-            # Styles density/coverage
-            if "n_release_style_links" in vals and n_releases > 0:
-                v = safe_bp(vals["n_release_style_links"], n_releases)
-                insert_kpi_event(args.trino_container, args.trino_catalog, event_ts, rid, schema_name,
-                                 "avg_styles_per_release_bp", v, "ok", "", args.schema_version)
-                eprint(f"[OK] avg_styles_per_release_bp={v}")
-
-            if "n_releases_with_style" in vals and n_releases > 0:
-                v = safe_bp(vals["n_releases_with_style"], n_releases)
-                insert_kpi_event(args.trino_container, args.trino_catalog, event_ts, rid, schema_name,
-                                 "pct_releases_with_style_bp", v, "ok", "", args.schema_version)
-                eprint(f"[OK] pct_releases_with_style_bp={v}")
-
-            # Genres density/coverage
-            if "n_release_genre_links" in vals and n_releases > 0:
-                v = safe_bp(vals["n_release_genre_links"], n_releases)
-                insert_kpi_event(args.trino_container, args.trino_catalog, event_ts, rid, schema_name,
-                                 "avg_genres_per_release_bp", v, "ok", "", args.schema_version)
-                eprint(f"[OK] avg_genres_per_release_bp={v}")
-
-            if "n_releases_with_genre" in vals and n_releases > 0:
-                v = safe_bp(vals["n_releases_with_genre"], n_releases)
-                insert_kpi_event(args.trino_container, args.trino_catalog, event_ts, rid, schema_name,
-                                 "pct_releases_with_genre_bp", v, "ok", "", args.schema_version)
-                eprint(f"[OK] pct_releases_with_genre_bp={v}")
-
-            # Label concentration shares (basis points)
-            total = vals.get("label_counts_total_releases", 0)
-            top1 = vals.get("top_label_releases", 0)
-            top10 = vals.get("top10_labels_releases", 0)
-
-            if total > 0:
-                v1 = safe_bp(top1, total)
-                insert_kpi_event(args.trino_container, args.trino_catalog, event_ts, rid, schema_name,
-                                 "top_label_share_bp", v1, "ok", "", args.schema_version)
-                eprint(f"[OK] top_label_share_bp={v1}")
-
-                v10 = safe_bp(top10, total)
-                insert_kpi_event(args.trino_container, args.trino_catalog, event_ts, rid, schema_name,
-                                 "top10_labels_share_bp", v10, "ok", "", args.schema_version)
-                eprint(f"[OK] top10_labels_share_bp={v10}")
+                refresh_kpi_materialized(args.trino_container, args.trino_catalog, snapshot_dir)
+                eprint("[OK] kpi_snapshot_materialized refreshed")
+            except Exception as e:
+                eprint(f"[WARN] kpi_snapshot_materialized not refreshed: {e}")
 
     eprint("==============================================")
     eprint(" DONE (kpi events appended)")
@@ -3,6 +3,7 @@
 
 import argparse
 import csv
+import io
 import os
 import re
 import subprocess
@@ -10,9 +11,20 @@ import sys
 from datetime import datetime, timezone
 from pathlib import Path
 
+try:
+    import trino  # optional: talk HTTP to the coordinator instead of docker exec + CLI
+    HAS_TRINO_CLIENT = True
+except ImportError:
+    trino = None
+    HAS_TRINO_CLIENT = False
+
 RUN_ID_RE = re.compile(r"^[0-9]{4}-[0-9]{2}__[0-9]{8}_[0-9]{6}$")
 
+KPI_EVENTS_TABLE = "hive.discogs_history.kpi_snapshot_events"
 KPI_LATEST_VIEW = "hive.discogs_history.kpi_snapshot_latest"
+# Snapshot of KPI_LATEST_VIEW refreshed by compute_kpis.py; read only while it is
+# not older than the newest event
+KPI_MATERIALIZED_TABLE = "hive.discogs_history.kpi_snapshot_materialized"
 REGISTRY_LATEST_VIEW = "hive.discogs_history.run_registry_latest"
 
 DEFAULT_REPORTS_SUBDIR = "_meta/discogs_history/reports"
@@ -34,7 +46,33 @@ def docker_exec(container: str, args: list[str], check: bool = True, capture: bo
     return run(["docker", "exec", "-i", container] + args, check=check, capture=capture)
 
 
+# Set by main() when --trino-host is given: connect() kwargs and one connection
+# reused for every query
+TRINO_HTTP: dict | None = None
+TRINO_CONN = None
+
+
+def cell_value(v) -> str:
+    # Same rendering as the CLI output, so both paths produce the same files
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, datetime):
+        return v.isoformat(" ", "milliseconds")
+    return str(v)
+
+
+def tsv_value(v) -> str:
+    return cell_value(v).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
 def trino_exec_tsv(container: str, catalog: str, sql: str) -> str:
+    if TRINO_CONN is not None:
+        cur = TRINO_CONN.cursor()
+        cur.execute(sql.strip().rstrip(";"))
+        return "\n".join("\t".join(map(tsv_value, r)) for r in cur.fetchall())
+
     cp = docker_exec(
         container,
         ["trino", "--output-format", "TSV", "--catalog", catalog, "--execute", sql],
@@ -45,6 +83,40 @@ def trino_exec_tsv(container: str, catalog: str, sql: str) -> str:
     return (cp.stdout or "").rstrip("\n")
 
 
+def trino_export_csv(container: str, catalog: str, sql: str, path: Path) -> None:
+    """Stream a query result to path as CSV with header, without holding it in memory."""
+    if TRINO_CONN is not None:
+        cur = TRINO_CONN.cursor()
+        cur.execute(sql.strip().rstrip(";"))
+        with path.open("w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f, quoting=csv.QUOTE_ALL)  # same quoting as CSV_HEADER
+            w.writerow([d[0] for d in cur.description])
+            for row in iter(cur.fetchone, None):
+                w.writerow(map(cell_value, row))
+        return
+
+    with path.open("wb") as f:
+        subprocess.run(
+            ["docker", "exec", "-i", container,
+             "trino", "--output-format", "CSV_HEADER", "--catalog", catalog, "--execute", sql],
+            check=True,
+            stdout=f,
+        )
+
+
+def sql_quote(s: str) -> str:
+    return "'" + s.replace("'", "''") + "'"
+
+
+def sql_ident(s: str) -> str:
+    return '"' + s.replace('"', '""') + '"'
+
+
+def tsv_rows(tsv: str):
+    # C tokenizer instead of splitlines()/split() per line; blank lines come back as []
+    return csv.reader(io.StringIO(tsv), delimiter="\t", quoting=csv.QUOTE_NONE)
+
+
 def require_env(name: str) -> str:
     v = os.environ.get(name, "")
     if not v:
@@ -61,14 +133,21 @@ def parse_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser(description="Export Discogs history KPI latest to CSV (long + wide).")
     ap.add_argument("--trino-container", required=True)
     ap.add_argument("--trino-catalog", required=True)
+    ap.add_argument("--trino-host", default="",
+                    help="Query the coordinator over HTTP (needs the 'trino' Python client)")
+    ap.add_argument("--trino-port", type=int, default=8080)
+    ap.add_argument("--trino-user", default="kpi")
     ap.add_argument("--out-dir", default="", help="Override output directory (default: $LAKE/_meta/discogs_history/reports)")
-    ap.add_argument("--include-active", action="store_true", help="Include active run KPIs if present in kpi_snapshot_latest")
+    ap.add_argument("--include-active", action="store_true", help="Include active run KPIs if present")
     ap.add_argument("--only-run-id", default="", help="Export only one run_id (safe mode)")
     ap.add_argument("--with-timestamp", action="store_true", help="Append UTC timestamp to filenames")
+    ap.add_argument("--from-view", action="store_true",
+                    help="Read kpi_snapshot_latest directly instead of kpi_snapshot_materialized")
     return ap.parse_args()
 
 
 def main() -> None:
+    global TRINO_HTTP, TRINO_CONN
     args = parse_args()
 
     lake_s = require_env("DISCOGS_DATA_LAKE")
@@ -78,6 +157,32 @@ def main() -> None:
     if args.only_run_id and not RUN_ID_RE.match(args.only_run_id):
         raise SystemExit(f"ERROR: invalid run_id format: {args.only_run_id}")
 
+    if args.trino_host:
+        if not HAS_TRINO_CLIENT:
+            raise SystemExit("ERROR: --trino-host needs the 'trino' Python client (pip install trino)")
+        TRINO_HTTP = dict(host=args.trino_host, port=args.trino_port, user=args.trino_user, catalog=args.trino_catalog)
+        TRINO_CONN = trino.dbapi.connect(**TRINO_HTTP)
+
+    # The snapshot is only as fresh as the last compute_kpis refresh: fall back to the
+    # view when an event is newer than anything in it (or it is empty)
+    kpi_source = KPI_LATEST_VIEW
+    if not args.from_view:
+        fresh = trino_exec_tsv(
+            args.trino_container,
+            args.trino_catalog,
+            f"""
+            SELECT coalesce(
+              (SELECT max(event_ts_utc) FROM {KPI_MATERIALIZED_TABLE})
+                >= (SELECT max(event_ts_utc) FROM {KPI_EVENTS_TABLE}),
+              false
+            )
+            """.strip(),
+        )
+        if fresh.strip() == "true":
+            kpi_source = KPI_MATERIALIZED_TABLE
+        else:
+            eprint("[WARN] kpi_snapshot_materialized is stale, reading kpi_snapshot_latest")
+
     out_dir = Path(args.out_dir) if args.out_dir else (lake / DEFAULT_REPORTS_SUBDIR)
     out_dir.mkdir(parents=True, exist_ok=True)
 
@@ -96,11 +201,7 @@ def main() -> None:
     """.strip()
 
     run_ids_tsv = trino_exec_tsv(args.trino_container, args.trino_catalog, run_filter_sql)
-    run_ids = []
-    for line in run_ids_tsv.splitlines():
-        rid = line.strip()
-        if rid:
-            run_ids.append(rid)
+    run_ids = [parts[0].strip() for parts in tsv_rows(run_ids_tsv) if parts and parts[0].strip()]
 
     if not run_ids:
         eprint("No runs selected (registry_latest returned empty set).")
@@ -108,92 +209,70 @@ def main() -> None:
 
     # Fetch KPI latest rows for selected runs
     # We join against the selected run ids to avoid exporting junk.
-    # Using VALUES list keeps it simple and stable.
-    values_rows = ", ".join([f"('{rid}')" for rid in run_ids])
-
-    kpi_sql = f"""
-    WITH sel(run_id) AS (
-      VALUES {values_rows}
+    # The selection is the registry filter itself (semi-join), not a literal
+    # run_id list: the SQL text stays the same size however many runs exist.
+    sel_cte = f"""
+    WITH sel AS (
+      {run_filter_sql}
+    ),
+    k AS (
+      SELECT l.*
+      FROM {kpi_source} l
+      JOIN sel s
+        ON l.run_id = s.run_id
     )
-    SELECT
-      k.event_ts_utc,
-      k.run_id,
-      k.schema_name,
-      k.kpi_name,
-      k.kpi_value,
-      k.status,
-      k.details
-    FROM {KPI_LATEST_VIEW} k
-    JOIN sel s
-      ON k.run_id = s.run_id
-    ORDER BY k.run_id, k.kpi_name
     """.strip()
 
-    kpi_tsv = trino_exec_tsv(args.trino_container, args.trino_catalog, kpi_sql)
-
-    long_rows = []
-    all_kpis = set()
-    for line in kpi_tsv.splitlines():
-        parts = line.split("\t")
-        if len(parts) < 7:
-            continue
-        event_ts, run_id, schema_name, kpi_name, kpi_value, status, details = parts[:7]
-        all_kpis.add(kpi_name)
-        long_rows.append(
-            {
-                "event_ts_utc": event_ts,
-                "run_id": run_id,
-                "schema_name": schema_name,
-                "kpi_name": kpi_name,
-                "kpi_value": kpi_value,
-                "status": status,
-                "details": details,
-            }
-        )
+    # Wide columns: every KPI name present for the selected runs (also failed-only ones)
+    kpi_names_tsv = trino_exec_tsv(
+        args.trino_container,
+        args.trino_catalog,
+        f"{sel_cte}\nSELECT DISTINCT kpi_name FROM k ORDER BY kpi_name",
+    )
+    kpi_list = [parts[0].strip() for parts in tsv_rows(kpi_names_tsv) if parts and parts[0].strip()]
 
-    if not long_rows:
-        eprint("No KPI rows found in kpi_snapshot_latest for selected runs.")
+    if not kpi_list:
+        eprint(f"No KPI rows found in {kpi_source} for selected runs.")
         return
 
-    # Build wide rows: one row per run_id
-    kpi_list = sorted(all_kpis)
-    wide_map = {}
-    for r in long_rows:
-        rid = r["run_id"]
-        wide_map.setdefault(rid, {})
-        wide_map[rid]["run_id"] = rid
-        wide_map[rid]["schema_name"] = r["schema_name"]
-        wide_map[rid]["event_ts_utc"] = r["event_ts_utc"]
-        # Only fill values for ok; keep failures as blank to avoid misleading zeros
-        if r["status"] == "ok":
-            wide_map[rid][r["kpi_name"]] = r["kpi_value"]
-        else:
-            wide_map[rid][r["kpi_name"]] = ""
-
-    # Stable order: run_id ascending
-    wide_rows = [wide_map[rid] for rid in sorted(wide_map.keys())]
-
     stamp = "_" + utc_now_stamp() if args.with_timestamp else ""
     long_path = out_dir / f"history_kpis_long_latest{stamp}.csv"
     wide_path = out_dir / f"history_kpis_wide_latest{stamp}.csv"
 
-    # Write LONG
-    long_fields = ["event_ts_utc", "run_id", "schema_name", "kpi_name", "kpi_value", "status", "details"]
-    with long_path.open("w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=long_fields)
-        w.writeheader()
-        for r in long_rows:
-            w.writerow(r)
-
-    # Write WIDE
-    wide_fields = ["run_id", "schema_name", "event_ts_utc"] + kpi_list
-    with wide_path.open("w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=wide_fields)
-        w.writeheader()
-        for r in wide_rows:
-            # ensure all columns exist
-            row = {k: r.get(k, "") for k in wide_fields}
-            w.writerow(row)
+    # Write LONG: streamed from Trino straight to disk
+    long_sql = f"""
+    {sel_cte}
+    SELECT
+      event_ts_utc,
+      run_id,
+      schema_name,
+      kpi_name,
+      kpi_value,
+      status,
+      details
+    FROM k
+    ORDER BY run_id, kpi_name
+    """.strip()
+    trino_export_csv(args.trino_container, args.trino_catalog, long_sql, long_path)
+
+    # Write WIDE: one row per run, pivoted in Trino.
+    # Only ok values are filled; failures stay blank to avoid misleading zeros.
+    pivot_cols = ",\n      ".join(
+        f"max(if(kpi_name = {sql_quote(name)} AND status = 'ok', kpi_value)) AS {sql_ident(name)}"
+        for name in kpi_list
+    )
+    wide_sql = f"""
+    {sel_cte}
+    SELECT
+      run_id,
+      max(schema_name) AS schema_name,
+      max(event_ts_utc) AS event_ts_utc,
+      {pivot_cols}
+    FROM k
+    GROUP BY run_id
+    ORDER BY run_id
+    """.strip()
+    trino_export_csv(args.trino_container, args.trino_catalog, wide_sql, wide_path)
 
     eprint("==============================================")
     eprint(" EXPORT KPI CSV (latest)")
@@ -1,12 +1,50 @@
 #!/usr/bin/env python3
 import argparse
 import calendar
+import http.client
+import json
+import os
 import sys
+import threading
+import time
+import urllib.parse
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 BASE = "https://discogs-data-dumps.s3.us-west-2.amazonaws.com"
 
+# esiti dei HEAD già fatti, per mese: {month: {"ts": epoch, "urls": {url: bool}}}
+CACHE_PATH = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "discogs_dump_probes.json"
+CACHE_TTL_S = 12 * 3600
+
+# una connessione HTTPS keep-alive per thread: un solo handshake TLS per
+# thread invece di uno per giorno sondato
+_tls = threading.local()
+
 def url_exists(url: str, timeout: int = 15) -> bool:
+    u = urllib.parse.urlsplit(url)
+    if u.scheme != "https":
+        return url_exists_urllib(url, timeout)
+
+    for attempt in range(2):  # 2° tentativo: la connessione riusata era stata chiusa dal server
+        conn = getattr(_tls, "conn", None)
+        if conn is None or conn.host != u.hostname:
+            conn = _tls.conn = http.client.HTTPSConnection(u.hostname, u.port or 443, timeout=timeout)
+        try:
+            conn.request("HEAD", u.path or "/")
+            resp = conn.getresponse()
+            resp.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            _tls.conn = None
+            continue
+        if 300 <= resp.status < 400:  # redirect: lascia fare a urllib
+            return url_exists_urllib(url, timeout)
+        return 200 <= resp.status < 300
+    return False
+
+def url_exists_urllib(url: str, timeout: int = 15) -> bool:
     req = urllib.request.Request(url, method="HEAD")
     try:
         with urllib.request.urlopen(req, timeout=timeout) as resp:
@@ -14,12 +52,43 @@ def url_exists(url: str, timeout: int = 15) -> bool:
     except Exception:
         return False
 
+def load_probe_cache(month: str) -> dict:
+    try:
+        entry = json.loads(CACHE_PATH.read_text()).get(month) or {}
+    except (OSError, ValueError, AttributeError):
+        return {}
+    if time.time() - entry.get("ts", 0) >= CACHE_TTL_S:
+        return {}
+    return dict(entry.get("urls") or {})
+
+def save_probe_cache(month: str, urls: dict) -> None:
+    try:
+        data = json.loads(CACHE_PATH.read_text())
+        if not isinstance(data, dict):
+            data = {}
+    except (OSError, ValueError):
+        data = {}
+    data[month] = {"ts": time.time(), "urls": urls}
+    try:
+        CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        tmp = CACHE_PATH.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data))
+        tmp.replace(CACHE_PATH)
+    except OSError:
+        pass  # cache best-effort: mai far fallire la ricerca
+
 def main() -> int:
     p = argparse.ArgumentParser()
     p.add_argument("--month", required=True, help="YYYY-MM, es. 2026-01")
     p.add_argument("--probe-type", default="artists",
                    choices=["artists","labels","masters","releases"],
                    help="Tipo usato per probing")
+    p.add_argument("--workers", type=int, default=8,
+                   help="HEAD in parallelo (default: 8)")
+    p.add_argument("--sequential", action="store_true",
+                   help="Un HEAD alla volta, dall'ultimo giorno a ritroso")
+    p.add_argument("--no-cache", action="store_true",
+                   help=f"Ignora e non aggiorna la cache dei probe ({CACHE_PATH})")
     args = p.parse_args()
 
     year_s, mon_s = args.month.split("-")
@@ -27,12 +96,51 @@ def main() -> int:
     mon = int(mon_s)
     last_day = calendar.monthrange(year, mon)[1]
 
-    for day in range(last_day, 0, -1):
-        ymd = f"{year:04d}{mon:02d}{day:02d}"
-        url = f"{BASE}/data/{year:04d}/discogs_{ymd}_{args.probe_type}.xml.gz"
-        if url_exists(url):
-            print(ymd)
-            return 0
+    days = [f"{year:04d}{mon:02d}{day:02d}" for day in range(last_day, 0, -1)]
+    urls = [f"{BASE}/data/{year:04d}/discogs_{ymd}_{args.probe_type}.xml.gz" for ymd in days]
+
+    # cache (TTL 12h): si sondano solo i giorni sconosciuti più recenti dell'ultimo
+    # hit noto; se sono tutti noti, zero richieste di rete
+    cached = {} if args.no_cache else load_probe_cache(args.month)
+    todo = []
+    cached_hit = None
+    for ymd, url in zip(days, urls):
+        known = cached.get(url)
+        if known:
+            cached_hit = ymd
+            break
+        if known is None:
+            todo.append((ymd, url))
+
+    found = None
+    if todo:
+        if args.sequential:
+            hits = map(url_exists, (url for _, url in todo))
+        else:
+            # tutti i giorni del mese in parallelo: ~1 RTT invece di ~N RTT.
+            # map() restituisce in ordine (giorno più recente prima), quindi il primo
+            # hit è comunque il più recente; gli altri probe vengono cancellati.
+            ex = ThreadPoolExecutor(max_workers=max(1, args.workers))
+            hits = ex.map(url_exists, (url for _, url in todo))
+
+        try:
+            for (ymd, url), ok in zip(todo, hits):
+                cached[url] = ok
+                if ok:
+                    found = ymd
+                    break
+        finally:
+            if not args.sequential:
+                ex.shutdown(wait=False, cancel_futures=True)
+
+        # solo se c'è un hit: un mese ancora senza dump va risondato al prossimo retry
+        if found and not args.no_cache:
+            save_probe_cache(args.month, cached)
+
+    found = found or cached_hit
+    if found:
+        print(found)
+        return 0
 
     print(f"ERROR: no Discogs dump found for month={args.month}", file=sys.stderr)
     return 2
@@ -2,14 +2,30 @@
 # -*- coding: utf-8 -*-
 
 import argparse
+import hashlib
+import http.client
+import json
 import os
 import re
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 from pathlib import Path
+from urllib.parse import urlsplit
+
+try:
+    import trino  # optional: talk HTTP to the coordinator instead of docker exec + CLI
+    HAS_TRINO_CLIENT = True
+except ImportError:
+    trino = None
+    HAS_TRINO_CLIENT = False
 
 RUN_ID_RE = re.compile(r"^[0-9]{4}-[0-9]{2}__[0-9]{8}_[0-9]{6}$")
+# Target of the lake's "active" symlink
+ACTIVE_TARGET_RE = re.compile(r"^_runs/([0-9]{4}-[0-9]{2}__[0-9]{8}_[0-9]{6})$")
 
 REQUIRED_DATASETS = [
     "artists_v1_typed",
@@ -176,20 +192,148 @@ CORE_SQL = """
   FROM hive.{schema}.artist_memberships_v1_typed;
 """
 
+DDL_OBJECT_RE = re.compile(r"CREATE (?:TABLE IF NOT EXISTS|OR REPLACE VIEW) hive\.\{schema\}\.(\w+)")
+
+def is_view_ddl(stmt: str) -> bool:
+    return "CREATE OR REPLACE VIEW" in stmt
+
+def split_ddl(sql_tmpl: str) -> list[tuple[str, str]]:
+    # (object_name, statement template) for each ';'-terminated CREATE in sql_tmpl
+    out: list[tuple[str, str]] = []
+    for stmt in sql_tmpl.split(";"):
+        m = DDL_OBJECT_RE.search(stmt)
+        if m:
+            out.append((m.group(1), stmt.strip() + ";"))
+    return out
+
+CORE_DDL = split_ddl(CORE_SQL)
+OPTIONAL_WAREHOUSE_DDL = [(rel, split_ddl(sql_tmpl)) for rel, sql_tmpl in OPTIONAL_WAREHOUSE]
+CORE_OBJECTS = {name for name, _ in CORE_DDL}
+
+# rid -> {registered_at, ddl_sha} of runs already reconciled (relative to DISCOGS_DATA_LAKE)
+REGISTRY_CACHE_HOST = "_meta/discogs_history/.registry_cache.json"
+# Any change to the DDL templates invalidates every cached run
+DDL_TEMPLATES_SHA = hashlib.sha256(
+    (CORE_SQL + "".join(rel + sql_tmpl for rel, sql_tmpl in OPTIONAL_WAREHOUSE)).encode("utf-8")
+)
+
 def eprint(msg: str) -> None:
     print(msg, file=sys.stderr)
 
 def utc_now() -> str:
     return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
 
-def run(cmd: list[str], check: bool = True, capture: bool = False) -> subprocess.CompletedProcess:
-    return subprocess.run(cmd, check=check, text=True, capture_output=capture)
-
-def docker_exec(container: str, args: list[str], check: bool = True, capture: bool = False) -> subprocess.CompletedProcess:
-    return run(["docker", "exec", "-i", container] + args, check=check, capture=capture)
-
-def trino_exec(container: str, catalog: str, sql: str) -> None:
-    docker_exec(container, ["trino", "--catalog", catalog, "--execute", sql], check=True, capture=False)
+def run(cmd: list[str], check: bool = True, capture: bool = False, input: str | None = None) -> subprocess.CompletedProcess:
+    return subprocess.run(cmd, check=check, text=True, capture_output=capture, input=input)
+
+def docker_exec(
+    container: str,
+    args: list[str],
+    check: bool = True,
+    capture: bool = False,
+    input: str | None = None,
+) -> subprocess.CompletedProcess:
+    return run(["docker", "exec", "-i", container] + args, check=check, capture=capture, input=input)
+
+# Set in main() with --trino-host: HTTP connection kwargs (one connection per thread)
+TRINO_HTTP: dict | None = None
+_tls = threading.local()
+# Set when a DDL session fails: HTTP sessions stop before their next statement
+ABORT = threading.Event()
+
+class TrinoStatementClient:
+    """
+    Minimal client for the coordinator's /v1/statement protocol (stdlib only), used for
+    --trino-host when the 'trino' package is not installed: POST the SQL, then follow
+    nextUri on the same keep-alive connection until the query is finished.
+    """
+
+    RETRY_STATUSES = (502, 503, 504)
+
+    def __init__(self, host: str, port: int, user: str, catalog: str) -> None:
+        self.conn = http.client.HTTPConnection(host, port, timeout=300)
+        self.headers = {"X-Trino-User": user, "X-Trino-Catalog": catalog}
+
+    def _request(self, method: str, path: str, body: bytes | None = None) -> dict:
+        for attempt in range(10):
+            self.conn.request(method, path, body=body, headers=self.headers)
+            resp = self.conn.getresponse()
+            data = resp.read()
+            if resp.status in self.RETRY_STATUSES:
+                time.sleep(0.05 * (attempt + 1))
+                continue
+            if resp.status != 200:
+                raise RuntimeError(f"Trino HTTP {resp.status}: {data[:500]!r}")
+            return json.loads(data)
+        raise RuntimeError(f"Trino HTTP {resp.status} after retries: {path}")
+
+    def execute(self, sql: str) -> list[list]:
+        doc = self._request("POST", "/v1/statement", sql.encode("utf-8"))
+        rows: list[list] = []
+        while True:
+            rows.extend(doc.get("data") or [])
+            if doc.get("error"):
+                raise RuntimeError(f"Trino query failed: {doc['error'].get('message', doc['error'])}")
+            next_uri = doc.get("nextUri")
+            if not next_uri:
+                return rows
+            # Only the path: the coordinator may advertise an address not reachable from here
+            u = urlsplit(next_uri)
+            doc = self._request("GET", u.path + (f"?{u.query}" if u.query else ""))
+
+def trino_conn():
+    conn = getattr(_tls, "conn", None)
+    if conn is None:
+        if HAS_TRINO_CLIENT:
+            conn = trino.dbapi.connect(**TRINO_HTTP)
+        else:
+            conn = TrinoStatementClient(**TRINO_HTTP)
+        _tls.conn = conn
+    return conn
+
+def http_query(sql: str) -> list:
+    # Rows of one statement over this thread's HTTP connection (fetching also drives DDL to completion)
+    conn = trino_conn()
+    if isinstance(conn, TrinoStatementClient):
+        return conn.execute(sql)
+    cur = conn.cursor()
+    cur.execute(sql)
+    return cur.fetchall()
+
+def trino_exec_script(container: str, catalog: str, statements: list[str]) -> None:
+    # HTTP: one request per statement on this thread's connection, stopping once
+    # another session has failed (ABORT).
+    # CLI: statements fed over stdin to one process (batch mode: exits on the first failing
+    # statement of this session; other running sessions finish their own batch);
+    # no argv size limit, unlike --execute
+    if TRINO_HTTP is not None:
+        for stmt in statements:
+            if ABORT.is_set():
+                raise SystemExit("ERROR: aborted, another Trino session failed")
+            http_query(stmt.strip().rstrip(";"))
+        return
+    docker_exec(container, ["trino", "--catalog", catalog], check=True, capture=False, input="\n".join(statements) + "\n")
+
+def trino_query(container: str, catalog: str, sql: str) -> list[list[str]]:
+    # Result rows as strings (NULL -> "")
+    if TRINO_HTTP is not None:
+        return [["" if v is None else str(v) for v in row] for row in http_query(sql)]
+    cp = docker_exec(
+        container,
+        ["trino", "--output-format", "TSV", "--catalog", catalog, "--execute", sql],
+        check=True,
+        capture=True,
+    )
+    return [line.split("\t") for line in (cp.stdout or "").splitlines() if line]
+
+def list_registered_objects(container: str, catalog: str) -> dict[str, set[str]]:
+    # Tables + views of every run schema (schema -> names), one metadata query for all runs
+    sql = "SELECT table_schema, table_name FROM hive.information_schema.tables WHERE table_schema LIKE 'discogs_r_%'"
+    out: dict[str, set[str]] = {}
+    for row in trino_query(container, catalog, sql):
+        if len(row) >= 2 and row[1].strip():
+            out.setdefault(row[0].strip(), set()).add(row[1].strip())
+    return out
 
 def validate_run_id(rid: str) -> None:
     if not rid or not RUN_ID_RE.match(rid):
@@ -200,19 +344,81 @@ def schema_for_run(rid: str) -> str:
     return "discogs_r_" + rid.replace("-", "_")
 
 def read_active_run_id(lake: Path) -> str:
-    active = lake / "active"
-    if not active.is_symlink():
+    # readlink fails with OSError when "active" is missing or not a symlink: one syscall
+    try:
+        target = os.readlink(lake / "active")
+    except OSError:
         return ""
-    target = os.readlink(active)
-    m = re.match(r"^_runs/([0-9]{4}-[0-9]{2}__[0-9]{8}_[0-9]{6})$", target)
+    m = ACTIVE_TARGET_RE.match(target)
     return m.group(1) if m else ""
 
 def list_runs(runs_dir: Path) -> list[str]:
-    out: list[str] = []
-    for p in runs_dir.iterdir():
-        if p.is_dir() and RUN_ID_RE.match(p.name):
-            out.append(p.name)
-    return sorted(out)
+    # scandir: name check first, then the type cached from readdir (no stat per entry)
+    match = RUN_ID_RE.match
+    with os.scandir(runs_dir) as it:
+        return sorted(e.name for e in it if match(e.name) and e.is_dir())
+
+def expected_objects(warehouse_rels: list[str]) -> set[str]:
+    # Tables/views a run gets: core + those of its present warehouse dirs
+    return CORE_OBJECTS | {name for rel, ddl in OPTIONAL_WAREHOUSE_DDL if rel in warehouse_rels for name, _ in ddl}
+
+def list_host_warehouse_dirs(run_dir: Path) -> list[str]:
+    # One listing of warehouse_discogs/ instead of a stat per OPTIONAL_WAREHOUSE dir
+    try:
+        with os.scandir(run_dir / "warehouse_discogs") as it:
+            names = {f"warehouse_discogs/{e.name}" for e in it if e.is_dir()}
+    except OSError:
+        return []
+    return [rel for rel, _ in OPTIONAL_WAREHOUSE if rel in names]
+
+def check_container_run_dirs(container: str, runs: list[str]) -> None:
+    # One docker exec for all runs: run dir + required datasets (authoritative for Trino paths)
+    subdirs = " ".join(['""'] + [f"/{ds}" for ds in REQUIRED_DATASETS])
+    script = (
+        f"for r in {' '.join(runs)}; do for d in {subdirs}; do "
+        f'test -d "/data/hive-data/_runs/$r$d" || {{ echo "/data/hive-data/_runs/$r$d"; exit 1; }}; '
+        "done; done"
+    )
+    cp = docker_exec(container, ["sh", "-lc", script], check=False, capture=True)
+    if cp.returncode != 0:
+        raise SystemExit(f"ERROR: missing dir in container: {(cp.stdout or '').strip() or '<docker exec failed>'}")
+
+def list_container_warehouse_dirs(container: str, runs: list[str]) -> dict[str, set[str]]:
+    # One docker exec for all runs: which OPTIONAL_WAREHOUSE dirs exist (rid -> set of rel)
+    rels = " ".join(rel for rel, _ in OPTIONAL_WAREHOUSE)
+    script = (
+        f"for r in {' '.join(runs)}; do for d in {rels}; do "
+        f'test -d "/data/hive-data/_runs/$r/$d" && printf "%s\\t%s\\n" "$r" "$d"; '
+        "done; done; true"
+    )
+    cp = docker_exec(container, ["sh", "-lc", script], check=True, capture=True)
+    present: dict[str, set[str]] = {rid: set() for rid in runs}
+    for line in (cp.stdout or "").splitlines():
+        rid, _, rel = line.partition("\t")
+        if rid in present:
+            present[rid].add(rel.strip())
+    return present
+
+def ddl_key(present_optional: list[str]) -> str:
+    # DDL templates + optional warehouse dirs present for the run
+    h = DDL_TEMPLATES_SHA.copy()
+    h.update("\n".join(sorted(present_optional)).encode("utf-8"))
+    return h.hexdigest()
+
+def load_registry_cache(path: Path) -> dict:
+    # Missing or unreadable cache: everything gets reconciled
+    try:
+        cache = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def save_registry_cache(path: Path, cache: dict) -> None:
+    # write-to-tmp + rename: a crash never leaves a truncated cache
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(cache, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
 
 def require_env(name: str) -> str:
     v = os.environ.get(name, "")
@@ -221,13 +427,32 @@ def require_env(name: str) -> str:
     return v
 
 def main() -> None:
+    global TRINO_HTTP
     ap = argparse.ArgumentParser(description="Ensure all historical run schemas are fully registered (fail-fast).")
     ap.add_argument("--trino-container", required=True)
     ap.add_argument("--trino-catalog", required=True)
+    ap.add_argument("--trino-host", default="",
+                    help="Run DDL/metadata queries over HTTP (the 'trino' Python client if installed, "
+                         "else a built-in /v1/statement client); "
+                         "the container is still used for the directory checks.")
+    ap.add_argument("--trino-port", type=int, default=8080)
+    ap.add_argument("--trino-user", default="reconcile")
     ap.add_argument("--include-active", action="store_true", help="Also register the active run (default: exclude).")
     ap.add_argument("--only-run-id", default="", help="If set, operate only on this run_id (for testing).")
+    ap.add_argument("--parallel-sessions", type=int, default=int(os.environ.get("RECONCILE_PARALLELISM", "4")),
+                    help="Trino sessions running the DDL concurrently, runs split across them "
+                         "(default: $RECONCILE_PARALLELISM or 4).")
+    ap.add_argument("--force-ddl", action="store_true",
+                    help="Re-issue every CREATE even for existing tables/views (e.g. after changing a view).")
+    ap.add_argument("--force-refresh", action="store_true",
+                    help=f"Ignore $DISCOGS_DATA_LAKE/{REGISTRY_CACHE_HOST} and check every run against Trino "
+                         "(e.g. after dropping a schema by hand).")
     args = ap.parse_args()
 
+    if args.trino_host:
+        # 'trino' client if installed, else the built-in /v1/statement client
+        TRINO_HTTP = dict(host=args.trino_host, port=args.trino_port, user=args.trino_user, catalog=args.trino_catalog)
+
     lake_s = require_env("DISCOGS_DATA_LAKE")
     if "/_runs/" in lake_s:
         raise SystemExit(f"ERROR: DISCOGS_DATA_LAKE must be base lake (not inside _runs): {lake_s}")
@@ -237,6 +462,7 @@ def main() -> None:
     if not runs_dir.is_dir():
         raise SystemExit(f"ERROR: runs dir not found: {runs_dir}")
 
+    # The active/ symlink is the authority (one readlink), not the manifest's run_id
     active_run = read_active_run_id(lake)
 
     eprint("==============================================")
@@ -248,9 +474,6 @@ def main() -> None:
     eprint(" mode   : FAIL-FAST")
     eprint("==============================================")
 
-    # Sanity: container reachable
-    docker_exec(args.trino_container, ["sh", "-lc", "true"], check=True)
-
     runs = list_runs(runs_dir)
     if args.only_run_id:
         validate_run_id(args.only_run_id)
@@ -260,31 +483,58 @@ def main() -> None:
         eprint("No runs found.")
         return
 
+    # Runs are immutable once registered: skip the ones reconciled with the same DDL
+    cache_path = lake / REGISTRY_CACHE_HOST
+    cache = load_registry_cache(cache_path)
+    use_cache = not (args.force_refresh or args.force_ddl)
+
     for rid in runs:
         validate_run_id(rid)
-
-        is_active = (rid == active_run) and bool(active_run)
-        if is_active and not args.include_active:
-            eprint(f"[SKIP] active run excluded: {rid}")
-            continue
-
+    if active_run and active_run in runs and not args.include_active:
+        eprint(f"[SKIP] active run excluded: {active_run}")
+        runs = [rid for rid in runs if rid != active_run]
+
+    # Discovery as one pass over the cache: cached runs never reach the pre-flight
+    host_warehouse = {rid: list_host_warehouse_dirs(runs_dir / rid) for rid in runs}
+    keys = {rid: ddl_key(host_warehouse[rid]) for rid in runs}
+    cached = {rid for rid in runs if use_cache and (cache.get(rid) or {}).get("ddl_sha") == keys[rid]}
+    if cached:
+        eprint(f"[SKIP] {len(cached)} runs cached as registered")
+
+    # Pre-flight for every run to process before registering any of them
+    selected = [rid for rid in runs if rid not in cached]
+    for rid in selected:
         run_dir_host = runs_dir / rid
         if not run_dir_host.is_dir():
             raise SystemExit(f"ERROR: run dir not found on host: {run_dir_host}")
 
-        # Host-side required dirs (fast guardrail)
+        # Host-side required dirs (fast guardrail), one directory listing per run
+        with os.scandir(run_dir_host) as it:
+            present = {e.name for e in it if e.is_dir()}
         for ds in REQUIRED_DATASETS:
-            p = run_dir_host / ds
-            if not p.is_dir():
-                raise SystemExit(f"ERROR: missing required dataset on host for {rid}: {p}")
-
-        # Container-side run dir must exist
-        docker_exec(args.trino_container, ["sh", "-lc", f"test -d /data/hive-data/_runs/{rid}"], check=True)
-
-        # Container-side required dirs (authoritative for Trino paths)
-        for ds in REQUIRED_DATASETS:
-            docker_exec(args.trino_container, ["sh", "-lc", f"test -d /data/hive-data/_runs/{rid}/{ds}"], check=True)
-
+            if ds not in present:
+                raise SystemExit(f"ERROR: missing required dataset on host for {rid}: {run_dir_host / ds}")
+
+    if selected:
+        # Trino metadata first: container probes only for runs with tables still missing
+        existing_objects = {} if args.force_ddl else list_registered_objects(args.trino_container, args.trino_catalog)
+        need_core = [rid for rid in selected if not CORE_OBJECTS <= existing_objects.get(schema_for_run(rid), set())]
+        need_all = [
+            rid for rid in selected
+            if not expected_objects(host_warehouse[rid]) <= existing_objects.get(schema_for_run(rid), set())
+        ]
+        if need_core:
+            check_container_run_dirs(args.trino_container, need_core)
+        # Runs with every expected object registered: the host listing is enough for their views
+        warehouse_dirs = {rid: set(host_warehouse[rid]) for rid in selected}
+        if need_all:
+            warehouse_dirs.update(list_container_warehouse_dirs(args.trino_container, need_all))
+
+    # DDL of every run (per-run statement lists), executed at the end
+    script: list[list[str]] = []
+    ensured: list[tuple[str, list[str]]] = []
+    script_runs: list[str] = []
+    for rid in selected:
         schema = schema_for_run(rid)
         run_base = f"file:/data/hive-data/_runs/{rid}"
         meta_loc = f"file:/data/hive-data/_meta/discogs_history/{schema}"
@@ -295,36 +545,64 @@ def main() -> None:
         eprint(f" base  : {run_base}")
         eprint(f" meta  : {meta_loc}")
 
-        # Create schema
-        trino_exec(
-            args.trino_container,
-            args.trino_catalog,
-            f"CREATE SCHEMA IF NOT EXISTS hive.{schema} WITH (location='{meta_loc}');",
-        )
-
-        # Core tables + views (idempotent)
-        trino_exec(
-            args.trino_container,
-            args.trino_catalog,
-            CORE_SQL.format(schema=schema, run_base=run_base),
-        )
-
-        # Optional warehouse (only if dirs exist)
-        for rel, sql_tmpl in OPTIONAL_WAREHOUSE:
-            container_path = f"/data/hive-data/_runs/{rid}/{rel}"
-            ok = docker_exec(args.trino_container, ["sh", "-lc", f"test -d {container_path}"], check=False).returncode == 0
-            if not ok:
+        # CREATE TABLE only for tables missing from the schema; views are always
+        # re-created, so a changed view definition reaches every processed run
+        existing = existing_objects.get(schema, set())
+        statements = [stmt for name, stmt in CORE_DDL if is_view_ddl(stmt) or name not in existing]
+        registered: list[str] = []
+        for rel, ddl in OPTIONAL_WAREHOUSE_DDL:
+            if rel not in warehouse_dirs[rid]:
                 eprint(f"[WARN] warehouse missing: {rel}")
                 continue
-
-            trino_exec(
-                args.trino_container,
-                args.trino_catalog,
-                sql_tmpl.format(schema=schema, run_base=run_base),
-            )
-            eprint(f"[OK] warehouse registered: {rel}")
-
-        eprint(f"[OK] ensured tables/views for hive.{schema}")
+            if any(not is_view_ddl(stmt) and name not in existing for name, stmt in ddl):
+                registered.append(rel)
+            statements.extend(stmt for name, stmt in ddl if is_view_ddl(stmt) or name not in existing)
+
+        statements.insert(0, f"CREATE SCHEMA IF NOT EXISTS hive.{{schema}} WITH (location='{meta_loc}');")
+        script.append([stmt.format(schema=schema, run_base=run_base) for stmt in statements])
+        ensured.append((schema, registered))
+        script_runs.append(rid)
+        eprint(f"[DDL] {len(statements)} statements queued")
+
+    if script:
+        # Runs are independent schemas: split them across a few Trino sessions so the
+        # metastore round-trips of different runs overlap
+        n = max(1, min(args.parallel_sessions, len(script)))
+        eprint("--------------------------------------------------")
+        eprint(f"[EXEC] {len(ensured)} schemas in {n} Trino session(s) ({'HTTP' if TRINO_HTTP else 'CLI'})")
+        with ThreadPoolExecutor(max_workers=n) as ex:
+            futures = {
+                ex.submit(
+                    trino_exec_script,
+                    args.trino_container,
+                    args.trino_catalog,
+                    [stmt for stmts in script[i::n] for stmt in stmts],
+                ): i
+                for i in range(n)
+            }
+            for fut in as_completed(futures):
+                try:
+                    fut.result()
+                except BaseException:
+                    # fail-fast: stop the other HTTP sessions before their next statement
+                    # (a CLI session already running finishes its batch)
+                    ABORT.set()
+                    ex.shutdown(wait=True, cancel_futures=True)
+                    eprint(f"[FAIL] Trino session {futures[fut] + 1}/{n} failed; its runs: "
+                           + " ".join(script_runs[futures[fut]::n]))
+                    raise
+        for schema, registered in ensured:
+            for rel in registered:
+                eprint(f"[OK] warehouse registered: hive.{schema} {rel}")
+            eprint(f"[OK] ensured tables/views for hive.{schema}")
+
+    if selected:
+        # Only reached when every session succeeded
+        registered_at = utc_now()
+        for rid in selected:
+            cache[rid] = {"registered_at": registered_at, "ddl_sha": keys[rid]}
+        save_registry_cache(cache_path, cache)
+        eprint(f"[OK] registry cache updated: {cache_path}")
 
     eprint("==============================================")
     eprint(" DONE")
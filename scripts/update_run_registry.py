@@ -6,10 +6,28 @@ import os
 import re
 import subprocess
 import sys
+import uuid
 from datetime import datetime, timezone
 from pathlib import Path
 
+try:
+    import trino  # optional: talk HTTP to the coordinator instead of docker exec + CLI
+    HAS_TRINO_CLIENT = True
+except ImportError:
+    trino = None
+    HAS_TRINO_CLIENT = False
+
+try:
+    import pyarrow as pa  # optional: write events as a Parquet file instead of INSERT
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    pa = pq = None
+    HAS_PYARROW = False
+
 RUN_ID_RE = re.compile(r"^[0-9]{4}-[0-9]{2}__[0-9]{8}_[0-9]{6}$")
+# Target of the lake's "active" symlink
+ACTIVE_TARGET_RE = re.compile(r"^_runs/([0-9]{4}-[0-9]{2}__[0-9]{8}_[0-9]{6})$")
 
 # Core required dirs (host-side check) aligned to your register_run_schema logic
 REQUIRED_DATASETS = [
@@ -34,6 +52,9 @@ REGISTRY_EVENTS_LOCATION = "file:/data/hive-data/_meta/discogs_history/registry/
 REGISTRY_EVENTS_DIR_CONTAINER = "/data/hive-data/_meta/discogs_history/registry/run_registry_events"
 REGISTRY_REGISTRY_DIR_CONTAINER = "/data/hive-data/_meta/discogs_history/registry"
 
+# Same events dir seen from the host (relative to DISCOGS_DATA_LAKE = /data/hive-data)
+REGISTRY_EVENTS_DIR_HOST = "_meta/discogs_history/registry/run_registry_events"
+
 
 def eprint(msg: str) -> None:
     print(msg, file=sys.stderr)
@@ -52,7 +73,27 @@ def docker_exec(container: str, args: list[str], check: bool = True, capture: bo
     return run(["docker", "exec", "-i", container] + args, check=check, capture=capture)
 
 
+# Set in main() with --trino-host: one HTTP connection reused by every statement
+TRINO_CONN = None
+
+
+def tsv_value(v) -> str:
+    # Same rendering as the CLI's TSV output, so both paths share the parsers
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    return str(v)
+
+
 def trino_exec(container: str, catalog: str, sql: str, capture: bool = False) -> subprocess.CompletedProcess:
+    if TRINO_CONN is not None:
+        cur = TRINO_CONN.cursor()
+        cur.execute(sql.strip().rstrip(";"))
+        rows = cur.fetchall()  # also drives non-SELECT statements to completion
+        stdout = "\n".join("\t".join(map(tsv_value, r)) for r in rows) if capture else None
+        return subprocess.CompletedProcess(["trino", sql], 0, stdout=stdout)
+
     args = ["trino", "--catalog", catalog, "--execute", sql]
     if capture:
         # Machine-readable output for parsing
@@ -60,6 +101,15 @@ def trino_exec(container: str, catalog: str, sql: str, capture: bool = False) ->
     return docker_exec(container, args, check=True, capture=capture)
 
 
+def trino_exec_statements(container: str, catalog: str, statements: list[str]) -> None:
+    # CLI: one --execute for all of them; HTTP: one request per statement (no multi-statement support)
+    if TRINO_CONN is not None:
+        for sql in statements:
+            trino_exec(container, catalog, sql)
+        return
+    trino_exec(container, catalog, "\n\n".join(statements))
+
+
 def require_env(name: str) -> str:
     v = os.environ.get(name, "")
     if not v:
@@ -73,20 +123,28 @@ def validate_base_lake(lake: str) -> None:
 
 
 def read_active_run_id(lake: Path) -> str:
-    active = lake / "active"
-    if not active.is_symlink():
+    # readlink fails with OSError when "active" is missing or not a symlink: one syscall
+    try:
+        target = os.readlink(lake / "active")
+    except OSError:
         return ""
-    target = os.readlink(active)
-    m = re.match(r"^_runs/([0-9]{4}-[0-9]{2}__[0-9]{8}_[0-9]{6})$", target)
+    m = ACTIVE_TARGET_RE.match(target)
     return m.group(1) if m else ""
 
 
 def list_run_ids(runs_dir: Path) -> list[str]:
-    out: list[str] = []
-    for p in runs_dir.iterdir():
-        if p.is_dir() and RUN_ID_RE.match(p.name):
-            out.append(p.name)
-    return sorted(out)
+    # scandir: name check first, then the type cached from readdir (no stat per entry)
+    match = RUN_ID_RE.match
+    with os.scandir(runs_dir) as it:
+        return sorted(e.name for e in it if match(e.name) and e.is_dir())
+
+
+def list_subdirs(path: Path) -> set[str]:
+    try:
+        with os.scandir(path) as it:
+            return {e.name for e in it if e.is_dir()}
+    except (FileNotFoundError, NotADirectoryError):
+        return set()
 
 
 def schema_for_run_id(run_id: str) -> str:
@@ -95,11 +153,8 @@ def schema_for_run_id(run_id: str) -> str:
 
 
 def missing_required_datasets(run_dir: Path) -> list[str]:
-    missing = []
-    for ds in REQUIRED_DATASETS:
-        if not (run_dir / ds).is_dir():
-            missing.append(ds)
-    return missing
+    present = list_subdirs(run_dir)
+    return [ds for ds in REQUIRED_DATASETS if ds not in present]
 
 
 def sql_escape(s: str) -> str:
@@ -107,22 +162,24 @@ def sql_escape(s: str) -> str:
 
 
 def ensure_registry_objects(container: str, catalog: str) -> None:
-    # Ensure directories exist inside container for external_location
-    docker_exec(container, ["sh", "-lc", f"mkdir -p {REGISTRY_EVENTS_DIR_CONTAINER}"], check=True)
-    docker_exec(container, ["sh", "-lc", f"test -d {REGISTRY_EVENTS_DIR_CONTAINER}"], check=True)
-
-    # Create schema + events table (idempotent)
-    trino_exec(
+    # Ensure directories exist inside container for external_location; the same exec
+    # is the container reachability check (mkdir -p only succeeds if the dir exists after)
+    cp = docker_exec(
         container,
-        catalog,
-        f"CREATE SCHEMA IF NOT EXISTS {REGISTRY_SCHEMA} WITH (location='{REGISTRY_SCHEMA_LOCATION}');",
-        capture=False,
+        ["sh", "-lc", f"mkdir -p {REGISTRY_EVENTS_DIR_CONTAINER} && echo READY"],
+        check=False,
+        capture=True,
     )
+    if cp.returncode != 0 or "READY" not in (cp.stdout or ""):
+        raise SystemExit(f"ERROR: container {container} not ready: {(cp.stderr or '').strip()}")
 
-    trino_exec(
+    # Create schema + events table (idempotent), both in one CLI invocation
+    trino_exec_statements(
         container,
         catalog,
-        f"""
+        [
+            f"CREATE SCHEMA IF NOT EXISTS {REGISTRY_SCHEMA} WITH (location='{REGISTRY_SCHEMA_LOCATION}');",
+            f"""
         CREATE TABLE IF NOT EXISTS {REGISTRY_EVENTS_TABLE} (
           event_ts_utc   TIMESTAMP,
           run_id         VARCHAR,
@@ -142,71 +199,139 @@ def ensure_registry_objects(container: str, catalog: str) -> None:
           format = 'PARQUET'
         );
         """.strip(),
-        capture=False,
+        ],
     )
 
 
-def trino_table_exists(container: str, catalog: str, schema: str, table: str) -> bool:
-    sql = f"""
-    SELECT 1
+# Schemas per information_schema IN list
+SENTINEL_QUERY_BATCH = 500
+
+
+def list_existing_sentinel_schemas(container: str, catalog: str, schemas: list[str]) -> set[str]:
+    """Schemas (of the given ones) containing SENTINEL_TABLE, one query per SENTINEL_QUERY_BATCH."""
+    found: set[str] = set()
+    for i in range(0, len(schemas), SENTINEL_QUERY_BATCH):
+        in_list = ", ".join(f"'{sql_escape(s)}'" for s in schemas[i:i + SENTINEL_QUERY_BATCH])
+        sql = f"""
+    SELECT table_schema
     FROM hive.information_schema.tables
-    WHERE table_schema = '{sql_escape(schema)}'
-      AND table_name = '{sql_escape(table)}'
-    LIMIT 1
+    WHERE table_name = '{sql_escape(SENTINEL_TABLE)}'
+      AND table_schema IN ({in_list})
     """.strip()
 
-    cp = trino_exec(container, catalog, sql, capture=True)
-    out = (cp.stdout or "").strip()
-    # With TSV output, existence means we get "1"
-    return out == "1"
+        cp = trino_exec(container, catalog, sql, capture=True)
+        found.update(line.strip() for line in (cp.stdout or "").splitlines() if line.strip())
+    return found
 
 
-def insert_event(
-    container: str,
-    catalog: str,
-    event_ts: str,
-    run_id: str,
-    schema_name: str,
-    is_active: bool,
+# Rows per multi-row INSERT (keeps the statement text bounded)
+REGISTRY_INSERT_BATCH = 1000
+
+
+EVENT_INSERT_PREFIX = f"""INSERT INTO {REGISTRY_EVENTS_TABLE} (
+      event_ts_utc, run_id, schema_name, is_active, action, status, details,
+      dump_month, dump_date, run_mode, git_sha, schema_version
+    )
+    VALUES
+    """
+
+EVENT_ROW_TMPL = (
+    "(TIMESTAMP '{ts}', '{rid}', '{schema}', {active}, '{action}', '{status}', '{details}', "
+    "'{dm}', '{dd}', '{rm}', '{gs}', {sv})"
+)
+
+
+def event_row_constants(
     action: str,
-    status: str,
-    details: str,
     dump_month: str,
     dump_date: str,
     run_mode: str,
     git_sha: str,
     schema_version: int,
-) -> None:
-    is_active_lit = "true" if is_active else "false"
-
-    sql = f"""
-    INSERT INTO {REGISTRY_EVENTS_TABLE} (
-      event_ts_utc, run_id, schema_name, is_active, action, status, details,
-      dump_month, dump_date, run_mode, git_sha, schema_version
+) -> dict[str, str]:
+    """EVENT_ROW_TMPL fields shared by every event of one invocation, escaped once."""
+    return {
+        "action": sql_escape(action),
+        "dm": sql_escape(dump_month),
+        "dd": sql_escape(dump_date),
+        "rm": sql_escape(run_mode),
+        "gs": sql_escape(git_sha),
+        "sv": str(int(schema_version)),
+    }
+
+
+def build_event_row(
+    constants: dict[str, str],
+    event_ts: str,
+    run_id: str,
+    schema_name: str,
+    is_active: bool,
+    status: str,
+    details: str,
+) -> str:
+    """One run_registry_events VALUES tuple; written by insert_events()."""
+    return EVENT_ROW_TMPL.format_map({
+        **constants,
+        "ts": sql_escape(event_ts),
+        "rid": sql_escape(run_id),
+        "schema": sql_escape(schema_name),
+        "active": "true" if is_active else "false",
+        "status": sql_escape(status),
+        "details": sql_escape(details),
+    })
+
+
+def insert_events(container: str, catalog: str, rows: list[str]) -> None:
+    """Append rows with one multi-row INSERT per REGISTRY_INSERT_BATCH rows, in order."""
+    for i in range(0, len(rows), REGISTRY_INSERT_BATCH):
+        sql = EVENT_INSERT_PREFIX + ",\n    ".join(rows[i:i + REGISTRY_INSERT_BATCH]) + ";"
+        trino_exec(container, catalog, sql, capture=False)
+
+
+def write_events_parquet(events_dir: Path, events: list[tuple], args: argparse.Namespace) -> Path:
+    """
+    Write all events of this invocation as one Parquet file straight into the
+    external_location of run_registry_events (no Trino write). Written under a
+    hidden name and renamed, so Trino never lists a partial file.
+    events: (event_ts, run_id, schema_name, is_active, status, details)
+    """
+    n = len(events)
+    cols = list(zip(*events))
+    table = pa.table(
+        {
+            "event_ts_utc": pa.array(
+                [datetime.strptime(ts, "%Y-%m-%d %H:%M:%S") for ts in cols[0]], pa.timestamp("ms")
+            ),
+            "run_id": pa.array(cols[1], pa.string()),
+            "schema_name": pa.array(cols[2], pa.string()),
+            "is_active": pa.array(cols[3], pa.bool_()),
+            "action": pa.array([args.action] * n, pa.string()),
+            "status": pa.array(cols[4], pa.string()),
+            "details": pa.array(cols[5], pa.string()),
+            "dump_month": pa.array([args.dump_month] * n, pa.string()),
+            "dump_date": pa.array([args.dump_date] * n, pa.string()),
+            "run_mode": pa.array([args.run_mode] * n, pa.string()),
+            "git_sha": pa.array([args.git_sha] * n, pa.string()),
+            "schema_version": pa.array([args.schema_version] * n, pa.int64()),
+        }
     )
-    VALUES (
-      TIMESTAMP '{sql_escape(event_ts)}',
-      '{sql_escape(run_id)}',
-      '{sql_escape(schema_name)}',
-      {is_active_lit},
-      '{sql_escape(action)}',
-      '{sql_escape(status)}',
-      '{sql_escape(details)}',
-      '{sql_escape(dump_month)}',
-      '{sql_escape(dump_date)}',
-      '{sql_escape(run_mode)}',
-      '{sql_escape(git_sha)}',
-      {schema_version}
-    );
-    """.strip()
-
-    trino_exec(container, catalog, sql, capture=False)
+    stamp = cols[0][0].replace("-", "").replace(":", "").replace(" ", "_")
+    name = f"events_{stamp}_{uuid.uuid4().hex[:8]}.parquet"
+    tmp = events_dir / f".{name}.tmp"
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, events_dir / name)
+    return events_dir / name
 
 
 def parse_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser(description="Append run status events into hive.discogs_history.run_registry_events.")
     ap.add_argument("--trino-container", required=True)
     ap.add_argument("--trino-catalog", required=True)
+    ap.add_argument("--trino-host", default="",
+                    help="Query the coordinator over HTTP (needs the 'trino' Python client); "
+                         "the container is still used for storage dirs")
+    ap.add_argument("--trino-port", type=int, default=8080)
+    ap.add_argument("--trino-user", default="registry")
     ap.add_argument("--action", default="update_registry")
     ap.add_argument("--schema-version", type=int, default=1)
     ap.add_argument("--only-run-id", default="")
@@ -215,10 +340,14 @@ def parse_args() -> argparse.Namespace:
     ap.add_argument("--dump-date", default="")
     ap.add_argument("--run-mode", default="history")
     ap.add_argument("--git-sha", default="")
+    ap.add_argument("--insert-events", action="store_true",
+                    help="Write events with INSERT through Trino instead of a Parquet file "
+                         "in the host-side events dir")
     return ap.parse_args()
 
 
 def main() -> None:
+    global TRINO_CONN
     args = parse_args()
 
     lake_s = require_env("DISCOGS_DATA_LAKE")
@@ -229,12 +358,17 @@ def main() -> None:
     if not runs_dir.is_dir():
         raise SystemExit(f"ERROR: runs dir not found: {runs_dir}")
 
-    # Sanity: container reachable
-    docker_exec(args.trino_container, ["sh", "-lc", "true"], check=True)
+    if args.trino_host:
+        if not HAS_TRINO_CLIENT:
+            raise SystemExit("ERROR: --trino-host needs the 'trino' Python client (pip install trino)")
+        TRINO_CONN = trino.dbapi.connect(
+            host=args.trino_host, port=args.trino_port, user=args.trino_user, catalog=args.trino_catalog
+        )
 
     # Ensure registry schema/table + dirs exist (this is the whole point of the refactor)
     ensure_registry_objects(args.trino_container, args.trino_catalog)
 
+    # The active/ symlink is the authority (one readlink), not the manifest's run_id
     active_run = read_active_run_id(lake)
 
     run_ids = list_run_ids(runs_dir)
@@ -257,6 +391,16 @@ def main() -> None:
     eprint(f" schema_version : {args.schema_version}")
     eprint("==============================================")
 
+    # Sentinel check for every candidate run with one metadata query instead of one per run
+    existing_sentinels = list_existing_sentinel_schemas(
+        args.trino_container,
+        args.trino_catalog,
+        [schema_for_run_id(rid) for rid in run_ids if RUN_ID_RE.match(rid) and rid != active_run],
+    )
+
+    # All events of this invocation, written once at the end:
+    # (event_ts, run_id, schema_name, is_active, status, details)
+    events: list[tuple] = []
     for rid in run_ids:
         if not RUN_ID_RE.match(rid):
             continue
@@ -265,22 +409,7 @@ def main() -> None:
 
         if is_active:
             if args.include_active:
-                insert_event(
-                    args.trino_container,
-                    args.trino_catalog,
-                    utc_now_ts(),
-                    rid,
-                    "discogs",
-                    True,
-                    args.action,
-                    "skipped_active",
-                    "excluded_by_active_symlink",
-                    args.dump_month,
-                    args.dump_date,
-                    args.run_mode,
-                    args.git_sha,
-                    args.schema_version,
-                )
+                events.append((utc_now_ts(), rid, "discogs", True, "skipped_active", "excluded_by_active_symlink"))
                 eprint(f"[ACTIVE] logged skipped_active: {rid}")
             else:
                 eprint(f"[SKIP] active run not logged (use --include-active): {rid}")
@@ -292,47 +421,30 @@ def main() -> None:
         schema = schema_for_run_id(rid)
 
         if missing:
-            insert_event(
-                args.trino_container,
-                args.trino_catalog,
-                utc_now_ts(),
-                rid,
-                schema,
-                False,
-                args.action,
-                "missing_data",
-                "missing_datasets=" + " ".join(missing),
-                args.dump_month,
-                args.dump_date,
-                args.run_mode,
-                args.git_sha,
-                args.schema_version,
-            )
+            events.append((utc_now_ts(), rid, schema, False, "missing_data", "missing_datasets=" + " ".join(missing)))
             eprint(f"[MISS] {rid} -> missing_data ({' '.join(missing)})")
             continue
 
-        ok = trino_table_exists(args.trino_container, args.trino_catalog, schema, SENTINEL_TABLE)
+        ok = schema in existing_sentinels
         status = "ok" if ok else "failed_incomplete"
         details = "sentinel_ok" if ok else f"sentinel_missing={SENTINEL_TABLE}"
 
-        insert_event(
-            args.trino_container,
-            args.trino_catalog,
-            utc_now_ts(),
-            rid,
-            schema,
-            False,
-            args.action,
-            status,
-            details,
-            args.dump_month,
-            args.dump_date,
-            args.run_mode,
-            args.git_sha,
-            args.schema_version,
-        )
+        events.append((utc_now_ts(), rid, schema, False, status, details))
         eprint(f"[LOG] {rid} -> {status} (schema hive.{schema})")
 
+    # The events table is external: a Parquet file dropped in its dir is read by Trino
+    # directly, so no INSERT is needed when the dir is on this host
+    events_dir = lake / REGISTRY_EVENTS_DIR_HOST
+    if events and not args.insert_events and HAS_PYARROW and events_dir.is_dir():
+        out = write_events_parquet(events_dir, events, args)
+        eprint(f"[OK] {len(events)} events written: {out}")
+    else:
+        # One INSERT for all runs instead of one docker exec + Trino statement per event
+        constants = event_row_constants(
+            args.action, args.dump_month, args.dump_date, args.run_mode, args.git_sha, args.schema_version
+        )
+        insert_events(args.trino_container, args.trino_catalog, [build_event_row(constants, *e) for e in events])
+
     eprint("==============================================")
     eprint(" DONE (events appended)")
     eprint("==============================================")